@@ -5,12 +5,22 @@ The app.py file contains the main application logic.
 """
 
 
-from flask import Flask, render_template, send_from_directory
+import json
+import queue
+import threading
+from flask import Flask, Response, request, render_template, send_from_directory
 from backend.connectors import CourseConnector
-from backend.activity_service import ActivityService
-from backend.activity_blueprint_service import ActivityBlueprintService
 from backend.helpers import setup_logger
-from backend.helpers import rename_log_file_to_activity_id
+from backend.helpers import load_activity_blueprint_config
+from backend.helpers import load_activity_blueprint_batch_config
+from backend.job_queue import JobQueue
+from backend.workspace import JobWorkspace
+from backend.history_store import get_history_store, HISTORY_PAGE_SIZE
+from backend.http_client import flush_http_latency_stats, get_process_latency_stats
+
+
+HISTORY_MAX_PAGE_SIZE = 500
+HISTORY_FILTERS = ["group_alias", "cefr_level", "analyst", "date_from", "date_to", "word"]
 
 
 app = Flask(__name__,
@@ -18,6 +28,7 @@ app = Flask(__name__,
             static_folder='frontend/static')
 
 logger = setup_logger()
+job_queue = JobQueue()
 
 @app.route('/')
 def index():
@@ -26,53 +37,129 @@ def index():
 @app.route('/baba')
 def build_activity_blueprint_automatically():
     try:
-        logger.info(f"Job run started. Calling route '/baba'. Invoking 'build_activity_blueprint_automatically' method.")
-        activity_blueprint_service = ActivityBlueprintService()
-        activity_blueprint_service.build_activity_blueprint()
-        # activity_blueprint_service.analyze_activity_blueprint()
-        logger.info(f"Job run completed. Exit code 0")
-        return '''
-            <html>
-                <head>
-                    <script type="text/javascript">
-                        window.onload = function() {
-                            wi00 ndow.location.href = '/';
-                        }
-                    </script>
-                </head>
-                <body>
-                    Activity blueprint built successfully. Validate data/activity_blueprint.json before running /build route.
-                </body>
-            </html>
-        '''
+        logger.info(f"Calling route '/baba'. Queueing 'activity_blueprint' job.")
+        workspace = JobWorkspace.create(load_activity_blueprint_config())
+        job_id = job_queue.enqueue("activity_blueprint", {"activity_id": workspace.activity_id})
+        return {"job_id": job_id, "activity_id": workspace.activity_id, "status_url": f"/jobs/{job_id}"}, 202
+    except Exception as e:
+        return f'Error: {e}'
+
+@app.route('/baba/stream')
+def build_activity_blueprint_streaming():
+    """
+    Builds the activity blueprint like '/baba' and pushes the partially generated
+    sentence, image style and questions to the client as server-sent events.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            logger.info(f"Job run started. Calling route '/baba/stream'. Invoking 'build_activity_blueprint_streaming' method.")
+            # The generation stack is imported on first use to keep the app's cold start small.
+            from backend.activity_blueprint_service import ActivityBlueprintService
+            activity_blueprint_service = ActivityBlueprintService()
+            activity_blueprint_service.builder.on_partial_sentence = lambda fields: events.put(("partial", fields))
+            activity_blueprint_service.build_activity_blueprint()
+            events.put(("complete", activity_blueprint_service.builder.activity.to_dict()))
+            logger.info(f"Job run completed. Exit code 0")
+        except Exception as e:
+            events.put(("error", {"message": str(e)}))
+        finally:
+            events.put(None)
+
+    def stream():
+        threading.Thread(target=run, daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            name, data = event
+            yield f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/baba/batch')
+def build_activity_blueprints_in_batch():
+    """
+    Queues a batch build of the targets in config/build_activity_blueprint/batch.json.
+    The config is snapshotted into the job; the job result points to the batch report.
+    """
+    try:
+        logger.info(f"Calling route '/baba/batch'. Queueing 'activity_blueprint_batch' job.")
+        # A retry would rebuild every target, so failed batches are not retried.
+        job_id = job_queue.enqueue("activity_blueprint_batch", {"batch_config": load_activity_blueprint_batch_config()}, max_attempts=1)
+        return {"job_id": job_id, "status_url": f"/jobs/{job_id}"}, 202
     except Exception as e:
         return f'Error: {e}'
 
 @app.route('/build')
 def build_activity():
+    """
+    Queues the build of the blueprint given by the 'activity_id' query parameter,
+    or of the reviewed data/activity_blueprint.json when it is omitted. An image
+    generated earlier from the same prompt is reused unless 'force_regenerate_image'
+    is set. An 'activity_id' that is not a UUID or has no blueprint is rejected with 400.
+    """
     try:
-        logger.info(f"Job run started. Calling route '/build'. Invoking 'build_route' method.")
-        activity_service = ActivityService()
-        activity_service.analyze_activity()
-        activity_service.build_activity()
-        logger.info(f"Job run completed. Exit code 0")
-        return '''
-            <html>
-                <head>
-                    <script type="text/javascript">
-                        window.onload = function() {
-                            wi00 ndow.location.href = '/';
-                        }
-                    </script>
-                </head>
-                <body>
-                    Activity built successfully. Redirecting...
-                </body>
-            </html>
-        '''
+        logger.info(f"Calling route '/build'. Queueing 'activity' job.")
+        activity_id = request.args.get('activity_id')
+        if activity_id:
+            try:
+                activity_id = JobWorkspace.open(activity_id).activity_id
+            except (ValueError, FileNotFoundError) as e:
+                return {"error": str(e)}, 400
+        else:
+            # Snapshot the reviewed blueprint now, so a blueprint published by '/baba'
+            # before the job runs cannot change what gets built.
+            activity_id = JobWorkspace.from_legacy_blueprint().activity_id
+        force_regenerate_image = request.args.get('force_regenerate_image', '').lower() in ('1', 'true', 'yes')
+        job_id = job_queue.enqueue("activity", {"activity_id": activity_id, "force_regenerate_image": force_regenerate_image})
+        return {"job_id": job_id, "activity_id": activity_id, "status_url": f"/jobs/{job_id}"}, 202
     except Exception as e:
         return f'Error: {e}'
 
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found"}, 404
+    return {key: job[key] for key in ["id", "type", "status", "attempts", "max_attempts", "available_at", "stages", "result", "error", "created_at", "updated_at"]}
+
+@app.route('/history')
+def history():
+    """
+    Returns a page of built activities, newest first, as a streamed JSON document
+    {"items": [...], "next_cursor": ...}. Filters are passed as query parameters:
+    group_alias, cefr_level, analyst, date_from, date_to and word. Pass the
+    returned next_cursor as 'cursor' to read the following page; it is null on the
+    last page.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        cursor = int(cursor) if cursor else None
+    except ValueError:
+        return {"error": "'limit' and 'cursor' must be integers"}, 400
+    filters = {key: request.args[key] for key in HISTORY_FILTERS if request.args.get(key)}
+    logger.info(f"Calling route '/history'. Filters: {filters}, cursor: {cursor}, limit: {limit}")
+    # One extra row tells whether another page follows without a COUNT query.
+    records = get_history_store().query(filters, cursor=cursor, limit=limit + 1)
+
+    def stream():
+        yield '{"items": ['
+        last_seq = None
+        next_cursor = None
+        for i, (seq, data) in enumerate(records):
+            if i == limit:
+                next_cursor = last_seq
+                records.close()
+                break
+            yield data if i == 0 else f", {data}"
+            last_seq = seq
+        yield f'], "next_cursor": {json.dumps(next_cursor)}}}'
+
+    return Response(stream(), mimetype='application/json')
+
 @app.route('/course/slot_record/current/<assignee>')
 def current_slot(assignee):
     course = CourseConnector()
@@ -125,6 +212,18 @@ def cefr_level(course_id):
     level = course.get_cefr_level(course_id)
     return level
 
+@app.route('/stats/http')
+def http_stats():
+    """
+    Returns the latency counters of the requests made through the shared HttpClient,
+    per endpoint, added up across the web app and the job workers: the roster and
+    course services and the image downloads. OpenAI and S3 calls go through their
+    own SDK clients and are not included. Workers flush their counters after each
+    job, and every HTTP_STATS_FLUSH_SECONDS while one runs.
+    """
+    flush_http_latency_stats()
+    return get_process_latency_stats()
+
 @app.route('/data/<path:filename>')
 def data(filename):
     return send_from_directory('data', filename)
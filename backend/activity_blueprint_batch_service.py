@@ -0,0 +1,101 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the service class that builds fm-gai-lottie-reading-v1 activity blueprints in batches.
+"""
+
+
+import os
+import copy
+import json
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from backend.activity_blueprint_service import ActivityBlueprintService
+from backend.connectors import CourseConnector
+from backend.helpers import load_activity_blueprint_config
+from backend.helpers import load_activity_blueprint_batch_config
+from backend.helpers import get_assignee_for_analyst
+from backend.helpers import setup_logger
+
+
+BATCH_OUTPUT_DIR = 'data/activity_blueprints'
+
+
+class ActivityBlueprintBatchService:
+    """
+    Builds one activity blueprint per target on a bounded worker pool.
+
+    A target is either a single slot, {"analyst", "date", "group_alias"}, or every
+    slot of a teacher on a date, {"analyst", "date", "all_slots": true}. Each
+    blueprint is built in its own job workspace, data/jobs/<activity id>/, and the
+    run ends with a summary report in BATCH_OUTPUT_DIR.
+    """
+    def __init__(self, batch_config=None, max_workers=None, output_dir=BATCH_OUTPUT_DIR):
+        self.batch_config = batch_config or load_activity_blueprint_batch_config()
+        self.activity_blueprint_config = load_activity_blueprint_config()
+        self.max_workers = max_workers or self.batch_config.get("max_workers", 4)
+        self.output_dir = output_dir
+        self.course_connector = CourseConnector()
+        self.logger = setup_logger()
+
+    def expand_targets(self):
+        "Resolves 'all_slots' targets against the roster into one target per group."
+        targets = []
+        for target in self.batch_config["targets"]:
+            if not target.get("all_slots"):
+                targets.append(target)
+                continue
+            assignee = get_assignee_for_analyst(target["analyst"])
+            slots = self.course_connector.get_slot_records_for_date(assignee=assignee, date=target["date"])
+            group_aliases = []
+            for slot in slots:
+                group_alias = slot["assigned_group"]["alias"]
+                if group_alias not in group_aliases:
+                    group_aliases.append(group_alias)
+            for group_alias in group_aliases:
+                targets.append({"analyst": target["analyst"], "date": target["date"], "group_alias": group_alias})
+        return targets
+
+    def make_activity_blueprint_config(self, target):
+        config = copy.deepcopy(self.activity_blueprint_config)
+        config["slot"] = {"date": target["date"], "group_alias": target["group_alias"]}
+        if target.get("analyst"):
+            config["metadata"]["analyst"] = target["analyst"]
+        return config
+
+    def build_target(self, target):
+        result = {"target": target, "status": "failed", "activity_id": None, "output": None, "error": None}
+        try:
+            service = ActivityBlueprintService(activity_blueprint_config=self.make_activity_blueprint_config(target))
+            activity = service.build_activity_blueprint(publish=False)
+            result.update({"status": "success", "activity_id": activity.id, "output": service.workspace.activity_blueprint_path, "completion_usage": activity.metadata.get("completion_usage")})
+        except Exception as e:
+            self.logger.error(f"{self.__class__.__name__}: Building blueprint for target {target} failed - Error: {e}")
+            result["error"] = str(e)
+        return result
+
+    def build_activity_blueprints(self):
+        batch_id = str(uuid.uuid4())
+        started_at = datetime.now().isoformat()
+        self.logger.info(f"{self.__class__.__name__}: Invoking 'build_activity_blueprints' method for batch {batch_id}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        targets = self.expand_targets()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            results = list(executor.map(self.build_target, targets))
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        report_path = f"{self.output_dir}/batch_{batch_id}.json"
+        report = {
+            "batch_id": batch_id,
+            "report_path": report_path,
+            "started_at": started_at,
+            "finished_at": datetime.now().isoformat(),
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results
+        }
+        with open(report_path, 'w') as file:
+            json.dump(report, file, indent=4)
+        self.logger.info(f"{self.__class__.__name__}: Batch {batch_id} finished - {succeeded}/{len(results)} blueprints built. Report exported to {report_path}")
+        return report
@@ -6,26 +6,30 @@ This module contains the builder class for fm-gai-lottie-reading-v1 activity obj
 
 
 import uuid
-import random
 from backend.helpers import initialize_activity_data
 from backend.helpers import setup_logger
+from backend.job_logging import LogPayload
 from backend.helpers import load_activity_blueprint_config
 from backend.helpers import get_slot_weekday
 from backend.helpers import make_activity_prompt
 from backend.helpers import get_random_itoken
+from backend.helpers import make_prompt_rng
 from backend.connectors import FmLottieConnector, CourseConnector, ITokenConnector
 
 
 class FMGAILottieReadingActivityBlueprintBuilder:
-    def __init__(self, activity):
+    def __init__(self, activity, activity_blueprint_config=None, activity_id=None):
         self.assignee = None
+        self.activity_id = activity_id
         self.activity = activity
         self.data = initialize_activity_data()
-        self.activity_blueprint_config = load_activity_blueprint_config()
+        self.activity_blueprint_config = activity_blueprint_config or load_activity_blueprint_config()
+        self.course_connector = CourseConnector()
+        self.on_partial_sentence = None
         self.logger = setup_logger()
 
     def set_id(self):
-        self.activity.id = str(uuid.uuid4())
+        self.activity.id = self.activity_id or str(uuid.uuid4())
         self.logger.info(f"{self.__class__.__name__}: 'set_activity_id' method invoked - Activity ID set to: {self.activity.id}")
         return self
     
@@ -40,22 +44,21 @@ class FMGAILottieReadingActivityBlueprintBuilder:
             self.assignee = "teacher1"
         if self.activity_blueprint_config["metadata"].get("analyst") == "CPTFreedom":
             self.assignee = "teacher2"
-        self.logger.info(f"{self.__class__.__name__}: 'set_metadata' method invoked - Metadata set to: {self.activity.metadata}")
+        self.logger.info("%s: 'set_metadata' method invoked - Metadata set to: %s", self.__class__.__name__, LogPayload(self.activity.metadata))
         return self
 
     def set_sandbox_slot_record(self):
         "Sets the sandbox slot record based on the activity blueprint configuration."
-        course_connector = CourseConnector()
         if self.activity_blueprint_config["slot"] == "load_current_slot":
-            self.activity.metadata["sandbox_slot"] = course_connector.get_current_slot_record(assignee=self.assignee)
+            self.activity.metadata["sandbox_slot"] = self.course_connector.get_current_slot_record(assignee=self.assignee)
         else:
             slot_date = self.activity_blueprint_config["slot"]["date"]
             group_alias = self.activity_blueprint_config["slot"]["group_alias"]
-            slots = course_connector.get_slot_records_for_date(assignee=self.assignee, date=slot_date)
+            slots = self.course_connector.get_slot_records_for_date(assignee=self.assignee, date=slot_date)
             for slot in slots:
                 if slot["assigned_group"]["alias"] == group_alias:
                     self.activity.metadata["sandbox_slot"] = slot
-        self.logger.info(f"{self.__class__.__name__}: 'set_sandbox_slot_record' method invoked - Sandbox slot record set to: {self.activity.metadata['sandbox_slot']}")
+        self.logger.info("%s: 'set_sandbox_slot_record' method invoked - Sandbox slot record set to: %s", self.__class__.__name__, LogPayload(self.activity.metadata['sandbox_slot']))
         return self
     
     def set_itokens(self):
@@ -69,12 +72,11 @@ class FMGAILottieReadingActivityBlueprintBuilder:
             except Exception as e:
                 self.logger.error(f"{self.__class__.__name__}: 'set_itokens' method invoked - Error: {e}")
                 continue
-        self.logger.info(f"{self.__class__.__name__}: 'set_itokens' method invoked - iTokens set to: {self.activity.itokens}")
+        self.logger.info("%s: 'set_itokens' method invoked - iTokens set to: %s", self.__class__.__name__, LogPayload(self.activity.itokens))
         return self
     
     def set_cefr_level(self):
-        course_connector = CourseConnector()
-        self.activity.cefr_level = course_connector.get_cefr_level(course_id=self.activity.metadata["sandbox_slot"]["assigned_group"]["alias"])
+        self.activity.cefr_level = self.course_connector.get_cefr_level(course_id=self.activity.metadata["sandbox_slot"]["assigned_group"]["alias"])
         self.logger.info(f"{self.__class__.__name__}: 'set_cefr_level' method invoked - CEFR level set to: {self.activity.cefr_level}")
         return self
     
@@ -86,7 +88,6 @@ class FMGAILottieReadingActivityBlueprintBuilder:
     def set_target_vocabulary(self):
         print("set_target_vocabulary")
         target_vocabulary = []
-        course_connector = CourseConnector()
         sandbox_slot = self.activity.metadata["sandbox_slot"]
         print("sandbox_slot", sandbox_slot)
         weekday = get_slot_weekday(sandbox_slot)
@@ -94,7 +95,7 @@ class FMGAILottieReadingActivityBlueprintBuilder:
         print("course_id", course_id)
         print("self.assignee", self.assignee)
         print("weekday", weekday)
-        words_dict = course_connector.get_target_vocabulary(course_id=course_id, assignee=self.assignee, weekday=str(weekday))
+        words_dict = self.course_connector.get_target_vocabulary(course_id=course_id, assignee=self.assignee, weekday=str(weekday))
         print("words_dict", words_dict)
         for words in words_dict:
             words = words.get("words")
@@ -104,10 +105,10 @@ class FMGAILottieReadingActivityBlueprintBuilder:
         print("target_vocabulary", target_vocabulary)
         self.activity.target_vocabulary = target_vocabulary
         print("self.activity.target_vocabulary", self.activity.target_vocabulary)
-        target_materials = course_connector.get_target_material(course_id=course_id, assignee=self.assignee, weekday=str(weekday))
+        target_materials = self.course_connector.get_target_material(course_id=course_id, assignee=self.assignee, weekday=str(weekday))
         for material_record in target_materials:
             self.set_target_material(material_record)
-        self.logger.info(f"{self.__class__.__name__}: 'set_target_vocabulary' method invoked - Target vocabulary set to: {self.activity.target_vocabulary}")
+        self.logger.info("%s: 'set_target_vocabulary' method invoked - Target vocabulary set to: %s", self.__class__.__name__, LogPayload(self.activity.target_vocabulary))
         return self
     
     def set_target_material(self, material_record):
@@ -119,7 +120,7 @@ class FMGAILottieReadingActivityBlueprintBuilder:
             "url": material_record[13][0]["link"]["url"]
         }
         self.activity.metadata["target_material"].append(material)
-        self.logger.info(f"{self.__class__.__name__}: 'set_target_material' method invoked - Target material set to: {material}")
+        self.logger.info("%s: 'set_target_material' method invoked - Target material set to: %s", self.__class__.__name__, LogPayload(material))
         return self
 
     # TODO - Implement this method
@@ -131,13 +132,22 @@ class FMGAILottieReadingActivityBlueprintBuilder:
         target_vocabulary = self.activity.target_vocabulary
         itokens = self.activity.itokens
         data_point = None
+        # Seeded from the activity inputs rather than the activity id, so a re-run of
+        # the same slot builds the same prompt and is served from the completion cache.
+        rng = make_prompt_rng(
+            self.activity.metadata["sandbox_slot"],
+            self.activity.metadata["target_material"],
+            target_vocabulary,
+            self.activity_blueprint_config["prompt"],
+            self.activity_blueprint_config["ms_interest_token"]
+        )
         if self.activity_blueprint_config["ms_interest_token"]["active"]:
             if self.activity_blueprint_config["ms_interest_token"]["target_student"] == "random":
                 students = self.activity.metadata["sandbox_slot"]["students"]
-                random_alias = students[random.randint(0, len(students) - 1)]["alias"]
-                data_point = get_random_itoken(random_alias, itokens)
+                random_alias = students[rng.randint(0, len(students) - 1)]["alias"]
+                data_point = get_random_itoken(random_alias, itokens, rng=rng)
             else:
-                data_point = get_random_itoken(self.activity_blueprint_config["ms_interest_token"]["target_student"], itokens)
+                data_point = get_random_itoken(self.activity_blueprint_config["ms_interest_token"]["target_student"], itokens, rng=rng)
         ms_interest_token_logs = {
             "data_point": data_point,
             "target_student": self.activity_blueprint_config["ms_interest_token"]["target_student"]
@@ -148,19 +158,24 @@ class FMGAILottieReadingActivityBlueprintBuilder:
             target_vocabulary=target_vocabulary,
             data_point=data_point,
             personalize=self.activity_blueprint_config["ms_interest_token"],
-            students=self.activity.metadata["sandbox_slot"]["students"]
+            students=self.activity.metadata["sandbox_slot"]["students"],
+            rng=rng
         )
         fm_lottie = FmLottieConnector()
-        sentence = fm_lottie.make_activity_sentence(prompt)
+        if self.on_partial_sentence is not None:
+            sentence = fm_lottie.stream_activity_sentence(prompt, on_partial=self.on_partial_sentence)
+        else:
+            sentence = fm_lottie.make_activity_sentence(prompt)
+        self.activity.metadata["completion_usage"] = fm_lottie.last_usage
         self.activity.sentence = sentence["sentence"]
         self.set_questions(sentence["questions"])
         self.set_image_style(sentence["media"]["style"])
-        self.logger.info(f"{self.__class__.__name__}: 'set_sentence' method invoked - Sentence set to: {self.activity.sentence}")
+        self.logger.info("%s: 'set_sentence' method invoked - Sentence set to: %s", self.__class__.__name__, LogPayload(self.activity.sentence))
         return self
     
     def set_questions(self, questions):
         self.activity.questions = questions
-        self.logger.info(f"{self.__class__.__name__}: 'set_questions' method invoked - Options set to: {self.activity.questions}")
+        self.logger.info("%s: 'set_questions' method invoked - Options set to: %s", self.__class__.__name__, LogPayload(self.activity.questions))
         return self
 
     def set_media(self):
@@ -176,7 +191,7 @@ class FMGAILottieReadingActivityBlueprintBuilder:
                 "loop": False
             }
         }
-        self.logger.info(f"{self.__class__.__name__}: 'set_media' method invoked - Media set to: {self.activity.media}")
+        self.logger.info("%s: 'set_media' method invoked - Media set to: %s", self.__class__.__name__, LogPayload(self.activity.media))
         return self
     
     def set_image_style(self, style_prompt):
@@ -9,38 +9,72 @@ from backend.activity import Activity
 from backend.activity_blueprint_builder import FMGAILottieReadingActivityBlueprintBuilder
 from backend.text_analyzer import TextAnalyzer
 from backend.helpers import export_activity_blueprint_data
+from backend.helpers import open_in_dev_editor, EXPORT_JSON_INDENT
 from backend.helpers import setup_logger
-from backend.helpers import rename_log_file_to_activity_id
+from backend.job_logging import LogPayload
+from backend.helpers import load_activity_blueprint_config
+from backend.step_graph import run_step_graph
+from backend.workspace import JobWorkspace, write_json_atomic, LEGACY_ACTIVITY_BLUEPRINT_PATH
+
+
+# Builder steps mapped to the steps they depend on, declared in the order of the
+# sequential builder chain. Steps that only need the sandbox slot (iTokens, CEFR
+# level, target vocabulary) are independent of each other and run concurrently.
+BLUEPRINT_BUILDER_STEPS = {
+    "set_id": [],
+    "set_metadata": [],
+    "set_sandbox_slot_record": ["set_metadata"],
+    "set_itokens": ["set_sandbox_slot_record"],
+    "set_cefr_level": ["set_sandbox_slot_record"],
+    "set_group_alias": ["set_sandbox_slot_record"],
+    "set_target_vocabulary": ["set_sandbox_slot_record"],
+    "set_target_grammar": [],
+    "set_media": [],
+    "set_sentence": ["set_itokens", "set_target_vocabulary", "set_media"],
+    "set_submitted": [],
+}
 
 
 class ActivityBlueprintService:
-    def __init__(self):
-        self.builder = FMGAILottieReadingActivityBlueprintBuilder(Activity())
+    def __init__(self, max_workers=4, activity_blueprint_config=None, workspace=None):
+        if workspace is None:
+            workspace = JobWorkspace.create(activity_blueprint_config or load_activity_blueprint_config())
+        self.workspace = workspace
+        self.builder = FMGAILottieReadingActivityBlueprintBuilder(Activity(), activity_blueprint_config or workspace.load_config(), activity_id=workspace.activity_id)
+        self.max_workers = max_workers
         self.logger = setup_logger()
 
-    def build_activity_blueprint(self):
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'build_activity_blueprint' method")
-        activity = (
-            self.builder.set_id()
-                        .set_metadata()
-                        .set_sandbox_slot_record()
-                        .set_itokens()
-                        .set_cefr_level()
-                        .set_group_alias()
-                        .set_target_vocabulary()
-                        .set_target_grammar()
-                        .set_media()
-                        .set_sentence()
-                        .set_submitted()
-                        .build()
-        )
-        activity_dict = activity.to_dict()
-        export_activity_blueprint_data(activity_dict)
-        rename_log_file_to_activity_id(self.logger, activity.id, "activity_blueprint")
-        self.logger.info(f"{self.__class__.__name__}: Status: success. Message: Activity blueprint 'id': activity.id built successfully. Exported to data/activity_blueprint.json. This object has no history of changes so be cautious when updating it.")
+    def make_activity_blueprint(self, on_step=None):
+        "Runs the builder steps and returns the activity without exporting it."
+        run_step_graph(self.builder, BLUEPRINT_BUILDER_STEPS, max_workers=self.max_workers, on_step=on_step)
+        return self.builder.build()
+
+    def build_activity_blueprint(self, on_step=None, publish=True):
+        """
+        Builds the blueprint inside the job workspace and exports it there. With
+        `publish`, the blueprint also atomically replaces data/activity_blueprint.json,
+        the copy analysts review before running '/build'.
+        """
+        with self.workspace.activate():
+            self.logger.info(f"{self.__class__.__name__}: Invoking 'build_activity_blueprint' method")
+            activity = self.make_activity_blueprint(on_step=on_step)
+            # Recorded for the analyst reviewing the blueprint before '/build'.
+            try:
+                activity.metadata["cefr_report"] = self.analyze_activity_blueprint()
+            except Exception as e:
+                self.logger.error(f"{self.__class__.__name__}: Error analyzing the CEFR level of the sentence - Error: {e}")
+            activity_dict = activity.to_dict()
+            error = export_activity_blueprint_data(activity_dict, file_path=self.workspace.activity_blueprint_path, open_in_editor=False)
+            if error is not None:
+                raise error
+            if publish:
+                write_json_atomic(LEGACY_ACTIVITY_BLUEPRINT_PATH, activity_dict, indent=EXPORT_JSON_INDENT)
+                open_in_dev_editor(LEGACY_ACTIVITY_BLUEPRINT_PATH)
+            self.logger.info(f"{self.__class__.__name__}: Status: success. Message: Activity blueprint 'id': {activity.id} built successfully. Exported to {self.workspace.activity_blueprint_path}. This object has no history of changes so be cautious when updating it.")
+        return activity
 
     def analyze_activity_blueprint(self):
         sentence = self.builder.activity.sentence
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'analyze_activity_blueprint' method for sentence: '{sentence}'")
+        self.logger.info("%s: Invoking 'analyze_activity_blueprint' method for sentence: %s", self.__class__.__name__, LogPayload(sentence))
         text_analyzer = TextAnalyzer(sentence)
-        text_analyzer.assess_sentence_language_level_cefrpy()
+        return text_analyzer.assess_sentence_language_level_cefrpy(self.builder.activity.cefr_level)
@@ -8,12 +8,14 @@ This module contains the builder class for fm-gai-lottie-true-false-v1 activity
 from backend.helpers import import_activity_data
 from backend.image_generator import ImageGenerator
 from backend.helpers import setup_logger
+from backend.job_logging import LogPayload
 
 
 class FMGAILottieReadingActivityActivityBuilder:
-    def __init__(self, activity):
+    def __init__(self, activity, activity_blueprint_path='data/activity_blueprint.json', force_regenerate_image=False):
         self.activity = activity
-        self.data = import_activity_data()
+        self.force_regenerate_image = force_regenerate_image
+        self.data = import_activity_data(activity_blueprint_path)
         self.logger = setup_logger()
 
     def set_id(self):
@@ -23,25 +25,27 @@ class FMGAILottieReadingActivityActivityBuilder:
 
     def set_metadata(self):
         self.activity.metadata = self.data["metadata"]
-        self.logger.info(f"{self.__class__.__name__}: 'set_metadata' method invoked - Metadata set to: {self.activity.metadata}")
+        self.logger.info("%s: 'set_metadata' method invoked - Metadata set to: %s", self.__class__.__name__, LogPayload(self.activity.metadata))
         return self
 
     def set_media(self):
         self.activity.media = self.data['media']
-        self.logger.info(f"{self.__class__.__name__}: 'set_media' method invoked - Media set to: {self.activity.media}")
+        self.logger.info("%s: 'set_media' method invoked - Media set to: %s", self.__class__.__name__, LogPayload(self.activity.media))
         return self
     
     def set_image_src(self):
         "Generates an image based on the activity style."
         image_generator = ImageGenerator(self.data)
-        image_url = image_generator.generate_image(image_id=self.activity.id)
+        image_url = image_generator.generate_image(image_id=self.activity.id, force_regenerate=self.force_regenerate_image)
         self.activity.media['image_src'] = image_url
+        if image_generator.image_srcset:
+            self.activity.media['image_srcset'] = image_generator.image_srcset
         self.logger.info(f"{self.__class__.__name__}: 'set_image_src' method invoked - Image URL set to: {image_url}")
         return self
     
     def set_itokens(self):
         self.activity.itokens = self.data["itokens"]
-        self.logger.info(f"{self.__class__.__name__}: 'set_itokens' method invoked - Itokens set to: {self.activity.itokens}")
+        self.logger.info("%s: 'set_itokens' method invoked - Itokens set to: %s", self.__class__.__name__, LogPayload(self.activity.itokens))
         return self
     
     def set_cefr_level(self):
@@ -56,7 +60,7 @@ class FMGAILottieReadingActivityActivityBuilder:
 
     def set_target_vocabulary(self):
         self.activity.target_vocabulary = self.data["target_vocabulary"]
-        self.logger.info(f"{self.__class__.__name__}: 'set_target_vocabulary' method invoked - Target vocabulary set to: {self.activity.target_vocabulary}")
+        self.logger.info("%s: 'set_target_vocabulary' method invoked - Target vocabulary set to: %s", self.__class__.__name__, LogPayload(self.activity.target_vocabulary))
         return self
 
     def set_target_grammar(self):
@@ -66,12 +70,12 @@ class FMGAILottieReadingActivityActivityBuilder:
 
     def set_sentence(self):
         self.activity.sentence = self.data["sentence"]
-        self.logger.info(f"{self.__class__.__name__}: 'set_sentence' method invoked - Sentence set to: {self.activity.sentence}")
+        self.logger.info("%s: 'set_sentence' method invoked - Sentence set to: %s", self.__class__.__name__, LogPayload(self.activity.sentence))
         return self
     
     def set_questions(self):
         self.activity.questions = self.data["questions"]
-        self.logger.info(f"{self.__class__.__name__}: 'set_options' method invoked - Questions set to: {self.activity.questions}")
+        self.logger.info("%s: 'set_options' method invoked - Questions set to: %s", self.__class__.__name__, LogPayload(self.activity.questions))
         return self
     
     def set_submitted(self):
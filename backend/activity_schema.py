@@ -0,0 +1,106 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the JSON schema and the local validator for generated reading activities.
+"""
+
+
+import json
+
+
+QUESTION_KEYS = ["1", "2", "3"]
+
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sentence": {"type": "string"},
+        "answer": {"type": "string"}
+    },
+    "required": ["sentence", "answer"],
+    "additionalProperties": False
+}
+
+ACTIVITY_COMPLETION_FIELDS = {
+    "media": {
+        "type": "object",
+        "properties": {
+            "style": {"type": "string"}
+        },
+        "required": ["style"],
+        "additionalProperties": False
+    },
+    "sentence": {"type": "string"},
+    "questions": {
+        "type": "object",
+        "properties": {key: QUESTION_SCHEMA for key in QUESTION_KEYS},
+        "required": QUESTION_KEYS,
+        "additionalProperties": False
+    }
+}
+
+
+def make_completion_schema(fields=None) -> dict:
+    "Returns the strict JSON schema of a completion containing `fields` (all fields by default)."
+    fields = fields or list(ACTIVITY_COMPLETION_FIELDS)
+    return {
+        "type": "object",
+        "properties": {field: ACTIVITY_COMPLETION_FIELDS[field] for field in fields},
+        "required": fields,
+        "additionalProperties": False
+    }
+
+
+def make_response_format(fields=None, name="reading_activity") -> dict:
+    "Returns the structured-output response_format constraining a completion to the schema."
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": make_completion_schema(fields)
+        }
+    }
+
+
+def is_non_empty_string(value) -> bool:
+    return isinstance(value, str) and value.strip() != ""
+
+
+def repair_activity_completion(activity: dict) -> dict:
+    "Applies local repairs that need no regeneration, such as decoding string-encoded questions."
+    questions = activity.get("questions")
+    if isinstance(questions, dict):
+        for key, question in questions.items():
+            if isinstance(question, str):
+                try:
+                    questions[key] = json.loads(question)
+                except ValueError:
+                    pass
+    return activity
+
+
+def validate_activity_completion(activity) -> dict:
+    """
+    Validates a parsed completion against the activity schema.
+
+    Returns a mapping of failing top-level field to a description of the problem;
+    an empty mapping means the completion is valid.
+    """
+    if not isinstance(activity, dict):
+        return {field: "completion is not a JSON object" for field in ACTIVITY_COMPLETION_FIELDS}
+    errors = {}
+    media = activity.get("media")
+    if not isinstance(media, dict) or not is_non_empty_string(media.get("style")):
+        errors["media"] = "'media.style' must be a non-empty string"
+    if not is_non_empty_string(activity.get("sentence")):
+        errors["sentence"] = "'sentence' must be a non-empty string"
+    questions = activity.get("questions")
+    if not isinstance(questions, dict) or sorted(questions) != QUESTION_KEYS:
+        errors["questions"] = f"'questions' must be an object with the keys {QUESTION_KEYS}"
+    else:
+        for key in QUESTION_KEYS:
+            question = questions[key]
+            if not isinstance(question, dict) or not is_non_empty_string(question.get("sentence")) or not is_non_empty_string(question.get("answer")):
+                errors["questions"] = f"'questions.{key}' must be an object with non-empty 'sentence' and 'answer' strings"
+                break
+    return errors
@@ -9,47 +9,70 @@ from backend.activity import Activity
 from backend.activity_builder import FMGAILottieReadingActivityActivityBuilder
 from backend.text_analyzer import TextAnalyzer
 from backend.helpers import export_activity_data
+from backend.helpers import open_in_dev_editor, EXPORT_JSON_INDENT
 from backend.helpers import append_activity_data_to_history_dataset
 from backend.helpers import setup_logger
-from backend.helpers import rename_log_file_to_activity_id
+from backend.job_logging import LogPayload
 from backend.helpers import upload_log_file_to_s3
+from backend.step_graph import run_step_graph
+from backend.workspace import JobWorkspace, write_json_atomic, LEGACY_ACTIVITY_PATH
+
+
+# Builder steps mapped to the steps they depend on, declared in the order of the
+# original builder chain. The image generation only needs the id and the media
+# record, so the plain field imports run alongside it.
+ACTIVITY_BUILDER_STEPS = {
+    "set_id": [],
+    "set_metadata": [],
+    "set_media": [],
+    "set_image_src": ["set_id", "set_media"],
+    "set_itokens": [],
+    "set_cefr_level": [],
+    "set_group_alias": [],
+    "set_target_vocabulary": [],
+    "set_target_grammar": [],
+    "set_sentence": [],
+    "set_questions": [],
+    "set_submitted": [],
+}
 
 
 class ActivityService:
-    def __init__(self):
-        self.builder = FMGAILottieReadingActivityActivityBuilder(Activity())
+    def __init__(self, max_workers=4, workspace=None, force_regenerate_image=False):
+        self.workspace = workspace or JobWorkspace.from_legacy_blueprint()
+        with self.workspace.activate():
+            self.builder = FMGAILottieReadingActivityActivityBuilder(Activity(), self.workspace.activity_blueprint_path, force_regenerate_image=force_regenerate_image)
+        self.max_workers = max_workers
         self.logger = setup_logger()
 
     def analyze_activity(self):
-        sentence = self.builder.data.get("sentence")
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'analyze_sentence' method for sentence: '{sentence}'")
-        text_analyzer = TextAnalyzer(sentence)
-        text_analyzer.assess_sentence_language_level_cefrpy()
-
-    def build_activity(self):
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'build_activity' method")
-        activity = (
-            self.builder.set_id()
-                        .set_metadata()
-                        .set_media()
-                        .set_image_src()
-                        .set_itokens()
-                        .set_cefr_level()
-                        .set_group_alias()
-                        .set_target_vocabulary()
-                        .set_target_grammar()
-                        .set_sentence()
-                        .set_questions()
-                        .set_submitted()
-                        .build()
-        )
-        activity_dict = activity.to_dict()
-        export_activity_data(activity_dict)
-        append_activity_data_to_history_dataset(activity_dict)
-        rename_log_file_to_activity_id(self.logger, activity.id, "activity")
-        upload_log_file_to_s3(activity.id, "activity")
+        with self.workspace.activate():
+            sentence = self.builder.data.get("sentence")
+            self.logger.info("%s: Invoking 'analyze_sentence' method for sentence: %s", self.__class__.__name__, LogPayload(sentence))
+            text_analyzer = TextAnalyzer(sentence)
+            return text_analyzer.assess_sentence_language_level_cefrpy(self.builder.data.get("cefr_level"))
+
+    def build_activity(self, on_step=None, publish=True):
+        """
+        Builds the activity from the workspace blueprint and exports it to the
+        workspace. With `publish`, it also atomically replaces data/activity.json,
+        the activity the reading frontend shows.
+        """
+        with self.workspace.activate():
+            self.logger.info(f"{self.__class__.__name__}: Invoking 'build_activity' method")
+            run_step_graph(self.builder, ACTIVITY_BUILDER_STEPS, max_workers=self.max_workers, on_step=on_step)
+            activity = self.builder.build()
+            activity_dict = activity.to_dict()
+            error = export_activity_data(activity_dict, file_path=self.workspace.activity_path, open_in_editor=False)
+            if error is not None:
+                raise error
+            if publish:
+                write_json_atomic(LEGACY_ACTIVITY_PATH, activity_dict, indent=EXPORT_JSON_INDENT)
+                open_in_dev_editor(LEGACY_ACTIVITY_PATH)
+            append_activity_data_to_history_dataset(activity_dict)
+        upload_log_file_to_s3(activity.id, "activity", log_file=self.workspace.log_path)
         return {
         "id": activity.id,
         "status": "success",
-        "message": "Activity built successfully. Exported to data/output.json."
+        "message": f"Activity built successfully. Exported to {self.workspace.activity_path}."
     }
@@ -0,0 +1,140 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the process-wide registry of external service clients and cached secrets.
+
+boto3 and openai are imported on first use, so that processes which never reach
+AWS or OpenAI, such as the web app serving '/data' and '/course', do not pay for
+importing them.
+"""
+
+
+import os
+import json
+import threading
+import time
+import asyncio
+import weakref
+
+
+AWS_REGION = 'eu-central-1'
+# Points the S3 client at a local S3-compatible stand-in (e.g. MinIO) in development and tests.
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+SECRET_TTL = 15 * 60
+
+
+class SecretUnavailableError(RuntimeError):
+    "Raised when a secret cannot be retrieved from AWS Secrets Manager."
+
+
+_lock = threading.RLock()
+_clients = {}
+_async_openai_clients = weakref.WeakKeyDictionary()
+_secrets = {}
+
+
+def get_boto3_client(service_name, region_name=AWS_REGION, endpoint_url=None):
+    "Returns a shared boto3 client for the service, creating it on first use."
+    key = ('boto3', service_name, region_name, endpoint_url)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                import boto3
+                client = boto3.client(service_name, region_name=region_name, endpoint_url=endpoint_url)
+                _clients[key] = client
+    return client
+
+
+def get_s3_client():
+    return get_boto3_client('s3', endpoint_url=S3_ENDPOINT_URL)
+
+
+def get_secret(secret_id: str, ttl=SECRET_TTL, refresh=False) -> dict:
+    """
+    Returns the parsed secret from AWS Secrets Manager, cached for `ttl` seconds.
+
+    Raises SecretUnavailableError when the secret cannot be fetched or parsed.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError
+    now = time.monotonic()
+    cached = _secrets.get(secret_id)
+    if not refresh and cached is not None and now - cached[0] < ttl:
+        return cached[1]
+    with _lock:
+        cached = _secrets.get(secret_id)
+        if not refresh and cached is not None and now - cached[0] < ttl:
+            return cached[1]
+        try:
+            response = get_boto3_client('secretsmanager').get_secret_value(SecretId=secret_id)
+            value = json.loads(response['SecretString'])
+        except (BotoCoreError, ClientError, KeyError, ValueError) as error:
+            raise SecretUnavailableError(f"Secret '{secret_id}' could not be retrieved: {error}") from error
+        _secrets[secret_id] = (time.monotonic(), value)
+        return value
+
+
+def get_openai_client(refresh=False):
+    "Returns the shared OpenAI client. With `refresh`, the API key is fetched again first."
+    client = _clients.get('openai')
+    if client is None or refresh:
+        with _lock:
+            client = _clients.get('openai')
+            if client is None or refresh:
+                api_key = get_secret('openai_key', refresh=refresh)['openai_key']
+                # Retries are owned by the rate limiter so that back-off is shared process-wide.
+                from openai import OpenAI
+                client = OpenAI(api_key=api_key, max_retries=0)
+                _clients['openai'] = client
+    return client
+
+
+def get_async_openai_client(refresh=False):
+    """
+    Returns the AsyncOpenAI client of the running event loop.
+
+    Async clients hold loop-bound connection pools, so one is kept per loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_openai_clients.get(loop)
+    if client is None or refresh:
+        with _lock:
+            client = _async_openai_clients.get(loop)
+            if client is None or refresh:
+                api_key = get_secret('openai_key', refresh=refresh)['openai_key']
+                from openai import AsyncOpenAI
+                client = AsyncOpenAI(api_key=api_key, max_retries=0)
+                _async_openai_clients[loop] = client
+    return client
+
+
+def call_openai(call):
+    """
+    Invokes `call(client)` with the shared OpenAI client.
+
+    On an authentication failure the key is assumed rotated: the secret and the
+    client are refreshed and the call is retried once.
+    """
+    from openai import AuthenticationError
+    try:
+        return call(get_openai_client())
+    except AuthenticationError:
+        return call(get_openai_client(refresh=True))
+
+
+async def call_openai_async(call):
+    "Async counterpart of call_openai: awaits `call(client)` with the loop's AsyncOpenAI client."
+    from openai import AuthenticationError
+    try:
+        return await call(get_async_openai_client())
+    except AuthenticationError:
+        return await call(get_async_openai_client(refresh=True))
+
+
+def reset_clients():
+    "Drops every cached client and secret."
+    with _lock:
+        _clients.clear()
+        _async_openai_clients.clear()
+        _secrets.clear()
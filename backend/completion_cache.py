@@ -0,0 +1,124 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the on-disk, content-addressed cache for LLM activity completions.
+"""
+
+
+import os
+import json
+import hashlib
+import threading
+
+
+COMPLETION_CACHE_DIR = os.environ.get('LLM_CACHE_DIR', 'data/cache/completions')
+COMPLETION_CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+# 'readwrite' serves hits and stores misses, 'replay' serves hits and never calls the
+# provider, 'off' bypasses the cache entirely.
+COMPLETION_CACHE_MODE = os.environ.get('LLM_CACHE_MODE', 'readwrite')
+
+CACHE_KEY_PARAMS = ["model", "messages", "temperature", "max_tokens", "top_p", "frequency_penalty", "presence_penalty", "response_format"]
+
+
+class CompletionCacheMiss(LookupError):
+    "Raised in replay mode when a completion is not cached."
+
+
+class CompletionCache:
+    """
+    Stores completion message contents under the SHA-256 of the request that
+    produced them (model, messages and sampling parameters).
+
+    The cache is bounded by total size; the least recently used entries, by file
+    mtime which is refreshed on every hit, are evicted first.
+    """
+    def __init__(self, directory=COMPLETION_CACHE_DIR, max_bytes=COMPLETION_CACHE_MAX_BYTES, mode=COMPLETION_CACHE_MODE):
+        if mode not in ('readwrite', 'replay', 'off'):
+            raise ValueError(f"Unknown completion cache mode: {mode}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.sizes = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(request: dict) -> str:
+        payload = {param: request.get(param) for param in CACHE_KEY_PARAMS}
+        encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        "Returns the cached message content, or None. In replay mode a miss raises CompletionCacheMiss."
+        if self.mode == 'off':
+            return None
+        path = self.path(key)
+        try:
+            with open(path, 'r') as file:
+                content = json.load(file)["content"]
+            os.utime(path)
+            return content
+        except (FileNotFoundError, KeyError, ValueError):
+            if self.mode == 'replay':
+                raise CompletionCacheMiss(f"Completion {key} is not cached and the cache is in replay mode.")
+            return None
+
+    def put(self, key, content, request=None):
+        if self.mode != 'readwrite':
+            return
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"key": key, "model": (request or {}).get("model"), "content": content}
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temp_path, path)
+        with self.lock:
+            sizes = self.load_sizes()
+            sizes[path] = os.path.getsize(path)
+            self.evict(sizes)
+
+    def load_sizes(self):
+        if self.sizes is None:
+            self.sizes = {}
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.json'):
+                        path = os.path.join(root, name)
+                        self.sizes[path] = os.path.getsize(path)
+        return self.sizes
+
+    def evict(self, sizes):
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = []
+        for path in sizes:
+            try:
+                by_age.append((os.path.getmtime(path), path))
+            except FileNotFoundError:
+                by_age.append((0, path))
+        for _, path in sorted(by_age):
+            if total <= self.max_bytes:
+                break
+            total -= sizes.pop(path)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+_completion_cache = None
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache() -> CompletionCache:
+    "Returns the process-wide CompletionCache configured from the LLM_CACHE_* environment."
+    global _completion_cache
+    if _completion_cache is None:
+        with _completion_cache_lock:
+            if _completion_cache is None:
+                _completion_cache = CompletionCache()
+    return _completion_cache
@@ -6,27 +6,68 @@ This module contains the logic for connecting to different external services.
 
 
 import json
-from openai import OpenAI
+import threading
 from .helpers import get_current_slot_record, get_slot_records_for_date, get_course_record, get_target_material, get_target_vocabulary, get_cefr_level
-from .helpers import get_secret_value
+from .helpers import get_target_vocabulary_for_material
+from .clients import call_openai, call_openai_async
+from .rate_limiter import get_rate_limiter, estimate_chat_tokens
+from .stream_parser import ActivityStreamParser
+from .completion_cache import get_completion_cache, CompletionCacheMiss
+from .activity_schema import ACTIVITY_COMPLETION_FIELDS, make_response_format, repair_activity_completion, validate_activity_completion
+from .helpers import invalidate_roster_cache
 from backend.helpers import setup_logger
+from backend.job_logging import LogPayload
+
+
+ACTIVITY_SYSTEM_PROMPT = (
+    "You are a helpful reading activity generator for language instructors. "
+    "Based on the prompt output a structured reading activity in a JSON format which contains a short reading paragraph (100 seconds reading time). "
+    "Base the sentence topic on the 'target_vocabulary'. Adhere to the language level in the attribute 'cefr_level'. "
+    "Your json response should return keys such as 'sentence', 'questions', 'media' : { 'style' : <best style desription goes here> }"
+)
+
+
+MAX_REPAIR_ATTEMPTS = 2
+
+
+def get_completion_usage(usage) -> dict:
+    "Extracts prompt, cached and completion token counts from an OpenAI usage object."
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "cached_tokens": getattr(details, "cached_tokens", None) or 0,
+        "completion_tokens": usage.completion_tokens
+    }
 
 
 class FmLottieConnector:
     def __init__(self):
-        self.client = OpenAI(api_key=get_secret_value('openai_key')['openai_key'])
+        self.last_usage = None
         self.logger = setup_logger()
 
-    def make_activity_sentence(self, prompt: str) -> str:
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'make_activity_sentence' method for prompt: '{prompt}'")
-        response = self.client.chat.completions.create(
+    def log_usage(self, usage):
+        "Adds the usage of one completion to the usage of the current activity."
+        usage = get_completion_usage(usage)
+        if usage is None:
+            return
+        if self.last_usage is None:
+            self.last_usage = usage
+        else:
+            self.last_usage = {key: self.last_usage[key] + usage[key] for key in usage}
+        self.logger.info(f"{self.__class__.__name__}: Completion usage - prompt tokens: {usage['prompt_tokens']}, cached tokens: {usage['cached_tokens']}, completion tokens: {usage['completion_tokens']}")
+
+    def make_completion_request(self, prompt: str) -> dict:
+        "Returns the chat completion arguments for the activity prompt."
+        return dict(
             model="gpt-4o",
             messages=[
                 {
                     "role": "system",
                     "content": [
                         {
-                            "text": "You are a helpful reading activity generator for language instructors. Based on the prompt output a structured reading activity in a JSON format which contains a short reading paragraph (100 seconds reading time). Base the sentence topic on the \"target_vocabulary\". Adhere to the language level in the attribute \"cefr_level\".  You are a helpful generator for language instructors creating reading activities. Base the sentence topic on the 'target_vocabulary'. Adhere to the language level in the attribute 'cefr_level' . Your json response should return keys such as 'sentence', 'questions', 'media' : { 'style' : <best style desription goes here> }: ",
+                            "text": ACTIVITY_SYSTEM_PROMPT,
                             "type": "text"
                         }
                     ]
@@ -46,18 +87,204 @@ class FmLottieConnector:
             top_p=1,
             frequency_penalty=0,
             presence_penalty=0,
-            response_format={
-                "type": "json_object"
+            response_format=make_response_format()
+        )
+
+    def make_repair_request(self, request: dict, previous_content: str, errors: dict) -> dict:
+        "Returns a follow-up request that regenerates only the failing fields of the previous answer."
+        fields = list(errors)
+        messages = request["messages"] + [
+            {"role": "assistant", "content": previous_content},
+            {
+                "role": "user",
+                "content": f"Some fields of your previous answer are invalid: {'; '.join(errors.values())}. Return a JSON object containing only the corrected fields: {', '.join(fields)}."
             }
+        ]
+        return dict(request, messages=messages, response_format=make_response_format(fields, name="reading_activity_repair"))
+
+    def parse_completion(self, content: str):
+        "Parses and locally repairs a completion. Returns the activity and its validation errors."
+        try:
+            activity = json.loads(content)
+        except (TypeError, ValueError):
+            activity = None
+        if isinstance(activity, dict):
+            activity = repair_activity_completion(activity)
+        return activity, validate_activity_completion(activity)
+
+    def merge_repair(self, activity, content: str, fields=ACTIVITY_COMPLETION_FIELDS) -> dict:
+        "Overwrites the requested `fields` with those returned by a repair completion; valid fields are kept."
+        activity = activity if isinstance(activity, dict) else {}
+        try:
+            repaired = json.loads(content)
+        except (TypeError, ValueError):
+            repaired = None
+        if isinstance(repaired, dict):
+            for field in fields:
+                if field in repaired:
+                    activity[field] = repaired[field]
+        return repair_activity_completion(activity)
+
+    def get_cached_activity(self, cache, cache_key):
+        """
+        Returns the cached activity for the key, ignoring entries that no longer
+        validate. In replay mode an invalid entry counts as a miss, as the provider
+        must not be called.
+        """
+        content = cache.get(cache_key)
+        if content is None:
+            return None
+        activity, errors = self.parse_completion(content)
+        if errors:
+            if cache.mode == 'replay':
+                raise CompletionCacheMiss(f"Cached completion {cache_key} is invalid and the cache is in replay mode: {errors}")
+            return None
+        self.logger.info(f"{self.__class__.__name__}: Completion served from cache. Key: {cache_key}")
+        return activity
+
+    def complete(self, request: dict) -> str:
+        tokens = estimate_chat_tokens(request["messages"], request["max_tokens"])
+        response = get_rate_limiter('chat').call(
+            lambda: call_openai(lambda client: client.chat.completions.create(**request)),
+            tokens=tokens
         )
-        message_content = response.choices[0].message.content
-        message_content = json.loads(message_content)
-        self.logger.info(f"{self.__class__.__name__}: Activity sentence generated successfully. Output: {message_content}")
+        self.log_usage(response.usage)
+        return response.choices[0].message.content
+
+    def repair_completion(self, request: dict, content: str):
+        """
+        Generator shared by the sync and async connectors: validates the completion
+        and yields a repair request for its failing fields, at most MAX_REPAIR_ATTEMPTS
+        times, expecting the repair completion to be sent back. Returns the activity
+        and raises ValueError if it is still invalid.
+        """
+        activity, errors = self.parse_completion(content)
+        attempt = 0
+        while errors:
+            if attempt == MAX_REPAIR_ATTEMPTS:
+                raise ValueError(f"Generated activity is still invalid after {attempt} repair attempts: {errors}")
+            attempt += 1
+            self.logger.warning(f"{self.__class__.__name__}: Repairing invalid fields (attempt {attempt}): {errors}")
+            previous_content = json.dumps(activity) if isinstance(activity, dict) else content
+            content = yield self.make_repair_request(request, previous_content, errors)
+            activity = self.merge_repair(activity, content, fields=list(errors))
+            errors = validate_activity_completion(activity)
+        return activity
+
+    def validate_completion(self, request: dict, content: str) -> dict:
+        "Validates the completion, regenerating only its failing fields, see repair_completion."
+        repairs = self.repair_completion(request, content)
+        try:
+            repair_request = next(repairs)
+            while True:
+                repair_request = repairs.send(self.complete(repair_request))
+        except StopIteration as done:
+            return done.value
+
+    def start_activity_sentence(self, prompt: str):
+        "Returns the completion request for the prompt, its cache and cache key, and the cached activity or None."
+        self.last_usage = None
+        request = self.make_completion_request(prompt)
+        cache = get_completion_cache()
+        cache_key = cache.make_key(request)
+        return request, cache, cache_key, self.get_cached_activity(cache, cache_key)
+
+    def make_activity_sentence(self, prompt: str) -> dict:
+        self.logger.info("%s: Invoking 'make_activity_sentence' method for prompt: %s", self.__class__.__name__, LogPayload(prompt))
+        request, cache, cache_key, message_content = self.start_activity_sentence(prompt)
+        if message_content is None:
+            message_content = self.validate_completion(request, self.complete(request))
+            cache.put(cache_key, json.dumps(message_content), request)
+        self.logger.info("%s: Activity sentence generated successfully. Output: %s", self.__class__.__name__, LogPayload(message_content))
+        return message_content
+
+    def iter_stream_content(self, stream):
+        "Yields the content deltas of a completion stream and logs the usage sent in its last chunk."
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                self.log_usage(chunk.usage)
+            if chunk.choices:
+                yield chunk.choices[0].delta.content
+
+    def stream_activity_sentence(self, prompt: str, on_partial=None) -> dict:
+        """
+        Streams the completion and calls `on_partial(fields)` whenever the sentence,
+        the image style or the questions advance. Returns the validated activity.
+        """
+        self.logger.info("%s: Invoking 'stream_activity_sentence' method for prompt: %s", self.__class__.__name__, LogPayload(prompt))
+        request, cache, cache_key, message_content = self.start_activity_sentence(prompt)
+        parser = ActivityStreamParser()
+        if message_content is not None:
+            chunks = [json.dumps(message_content)]
+        else:
+            tokens = estimate_chat_tokens(request["messages"], request["max_tokens"])
+            stream = get_rate_limiter('chat').call(
+                lambda: call_openai(lambda client: client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **request)),
+                tokens=tokens
+            )
+            chunks = self.iter_stream_content(stream)
+        for content in chunks:
+            if not content:
+                continue
+            updates = parser.feed(content)
+            if updates and on_partial is not None:
+                on_partial(updates)
+        if message_content is None:
+            message_content = self.validate_completion(request, parser.buffer)
+            cache.put(cache_key, json.dumps(message_content), request)
+            fields = {"sentence": message_content["sentence"], "media.style": message_content["media"]["style"], "questions": message_content["questions"]}
+            if on_partial is not None and fields != parser.fields:
+                on_partial(fields)
+        self.logger.info("%s: Activity sentence streamed successfully. Output: %s", self.__class__.__name__, LogPayload(message_content))
+        return message_content
+
+class AsyncFmLottieConnector(FmLottieConnector):
+    """
+    Asyncio variant of FmLottieConnector sharing the chat rate limiter. Only the
+    provider calls differ; caching, validation and repair are inherited.
+    """
+    async def complete(self, request: dict) -> str:
+        tokens = estimate_chat_tokens(request["messages"], request["max_tokens"])
+        response = await get_rate_limiter('chat').call_async(
+            lambda: call_openai_async(lambda client: client.chat.completions.create(**request)),
+            tokens=tokens
+        )
+        self.log_usage(response.usage)
+        return response.choices[0].message.content
+
+    async def validate_completion(self, request: dict, content: str) -> dict:
+        repairs = self.repair_completion(request, content)
+        try:
+            repair_request = next(repairs)
+            while True:
+                repair_request = repairs.send(await self.complete(repair_request))
+        except StopIteration as done:
+            return done.value
+
+    async def make_activity_sentence(self, prompt: str) -> dict:
+        self.logger.info("%s: Invoking 'make_activity_sentence' method for prompt: %s", self.__class__.__name__, LogPayload(prompt))
+        request, cache, cache_key, message_content = self.start_activity_sentence(prompt)
+        if message_content is None:
+            message_content = await self.validate_completion(request, await self.complete(request))
+            cache.put(cache_key, json.dumps(message_content), request)
+        self.logger.info("%s: Activity sentence generated successfully. Output: %s", self.__class__.__name__, LogPayload(message_content))
         return message_content
 
+    def stream_activity_sentence(self, prompt: str, on_partial=None) -> dict:
+        raise NotImplementedError(f"{self.__class__.__name__} does not stream; use FmLottieConnector.stream_activity_sentence")
+
 class CourseConnector:
+    """
+    Connector for roster and course data.
+
+    Course records and target material are memoized per instance, so a single
+    connector shared across one job fetches and walks each course only once,
+    even when builder steps call it from several threads.
+    """
     def __init__(self):
-        pass
+        self.course_records = {}
+        self.target_materials = {}
+        self.lock = threading.RLock()
 
     def get_current_slot_record(self, assignee):
         return get_current_slot_record(assignee)
@@ -65,22 +292,33 @@ class CourseConnector:
     def get_slot_records_for_date(self, assignee, date):
         "Accepts date in format '1.1.2024' and returns the slot records for that date."
         return get_slot_records_for_date(assignee, date)
+
+    def invalidate_roster_cache(self):
+        "Forces the next slot lookup to fetch the roster again."
+        invalidate_roster_cache()
     
     def get_course_record(self, course_id):
-        return get_course_record(course_id)
+        with self.lock:
+            if course_id not in self.course_records:
+                self.course_records[course_id] = get_course_record(course_id)
+            return self.course_records[course_id]
     
     def get_target_material(self, course_id, assignee, weekday):
         "Returns target material for this academic week"
-        course_record = get_course_record(course_id)
-        return get_target_material(course_record, assignee, weekday)
+        key = (course_id, assignee, str(weekday))
+        with self.lock:
+            if key not in self.target_materials:
+                course_record = self.get_course_record(course_id)
+                self.target_materials[key] = get_target_material(course_record, assignee, weekday)
+            return self.target_materials[key]
     
     def get_target_vocabulary(self, course_id, assignee, weekday):
         "Returns target vocabulary for this academic week"
-        course_record = get_course_record(course_id)
-        return get_target_vocabulary(course_record, assignee, weekday)
+        target_material = self.get_target_material(course_id, assignee, weekday)
+        return get_target_vocabulary_for_material(target_material)
     
     def get_cefr_level(self, course_id):
-        course_record = get_course_record(course_id)
+        course_record = self.get_course_record(course_id)
         return get_cefr_level(course_record)
 
 class ITokenConnector:
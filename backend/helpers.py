@@ -6,73 +6,111 @@ This module contains helper functions for importing and exporting activity data.
 
 
 import os
+import bisect
+import calendar
 import random
-import shutil
+import threading
+import time
 import json
-import boto3
-import requests
+import shlex
+import subprocess
+import hashlib
 from datetime import datetime
 import pytz
-from botocore.exceptions import BotoCoreError, ClientError
+from backend.http_client import get_http_client, HTTP_CONNECT_TIMEOUT
+from backend.clients import get_s3_client, get_secret
+from backend.workspace import WorkspaceLogHandler, WorkspaceLogFilter, write_json_atomic
+from backend.job_logging import configure_queue_logging, get_log_file_path, JsonFormatter, LogPayload, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from backend.history_store import get_history_store
+from backend.log_shipper import get_log_shipper
 import logging
 from logging.handlers import RotatingFileHandler
 import logging
 from datetime import datetime, timedelta
 
 
-def setup_logger():
-    "Returns a singleton logger instance."
-    logger = logging.getLogger('job_logger')
-    if not logger.hasHandlers():
-        handler = RotatingFileHandler('data/logs/job.log', maxBytes=10000, backupCount=10)
-        handler.setLevel(logging.INFO)
-        formatter = logging.Formatter('%(asctime)s %(levelname)s: %(message)s')
-        handler.setFormatter(formatter)
-        logger.setLevel(logging.INFO)
-        logger.addHandler(handler)
-        logger.propagate = False
-    return logger
+IMAGE_DOWNLOAD_READ_TIMEOUT = float(os.environ.get('IMAGE_DOWNLOAD_READ_TIMEOUT', '60'))
+IMAGE_UPLOAD_CHUNK_SIZE = int(os.environ.get('IMAGE_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+IMAGE_UPLOAD_MAX_CONCURRENCY = int(os.environ.get('IMAGE_UPLOAD_MAX_CONCURRENCY', '2'))
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+# Unset in production. In development, e.g. DEV_EDITOR=code opens exports and job
+# logs in VS Code and pretty-prints the exported JSON.
+DEV_EDITOR = os.environ.get('DEV_EDITOR', '')
+EXPORT_JSON_INDENT = 4 if DEV_EDITOR else None
 
 
-def rename_log_file_to_activity_id(logger, activity_id, job_type):
+def make_log_handlers():
+    log_file_path = get_log_file_path()
+    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+    handler = RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    handler.setLevel(logging.INFO)
+    handler.setFormatter(JsonFormatter())
+    return [handler, WorkspaceLogHandler()]
+
+
+def setup_logger():
     """
-    Rename the log file to include the activity ID at the end of the job run.
+    Returns a singleton logger instance. Records are written as JSON lines by a
+    background thread, see backend.job_logging.
     """
-    temp_log_file = 'data/logs/job.log'
-    new_log_file = f'data/logs/{job_type}_job_{activity_id}.log'
-    if os.path.exists(temp_log_file):
-        shutil.move(temp_log_file, new_log_file)
-        logger.info(f"Log file renamed to {new_log_file}")
-    else:
-        logger.error(f"Temporary log file {temp_log_file} does not exist")
+    logger = logging.getLogger('job_logger')
+    configure_queue_logging(logger, make_log_handlers, filters=[WorkspaceLogFilter()])
+    return logger
 
-def upload_log_file_to_s3(activity_id, job_type):
+
+def upload_log_file_to_s3(activity_id, job_type, log_file=None):
+    "Hands the job log to the background log shipper; the upload itself does not block the caller."
     logger = setup_logger()
-    client = boto3.client('s3', region_name='eu-central-1')
-    log_file = f'data/logs/{job_type}_job_{activity_id}.log'
+    log_file = log_file or f'data/logs/{job_type}_job_{activity_id}.log'
     key = f'job_{activity_id}.log'
-    client.upload_file(log_file, 'lottie.logs', key)
-    logger.info(f"Log file uploaded to S3 bucket with key: {key}")
+    get_log_shipper().submit(log_file, key)
+    logger.info(f"Log file queued for upload to S3 bucket with key: {key}")
     logger.info(f"Visit 'https://s3.eu-north-1.amazonaws.com/lottie.logs/{key}'")
-    os.system(f"code {log_file}")
+    open_in_dev_editor(log_file)
     return f"Log file uploaded successfully to S3 bucket."
 
-def upload_image_to_s3(image_file, image_id):
+
+class TeeReader:
+    "File-like reader that copies everything read from `source` into `copy_to`."
+    def __init__(self, source, copy_to):
+        self.source = source
+        self.copy_to = copy_to
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.copy_to.write(data)
+        return data
+
+
+def stream_image_to_s3(image_url, image_id, chunk_size=IMAGE_UPLOAD_CHUNK_SIZE, copy_to=None):
+    """
+    Pipes the image at `image_url` into S3 without holding the whole file in memory.
+
+    The HTTP body is read straight from the socket and uploaded in parts of
+    `chunk_size` bytes (at least the S3 minimum of 5 MiB), so a job buffers at most
+    IMAGE_UPLOAD_MAX_CONCURRENCY parts. Smaller images go up in a single request.
+    The stored content type is the one the image is served with. When `copy_to`
+    is given, the body is also written to that file object as it streams.
+    """
+    from boto3.s3.transfer import TransferConfig
     logger = setup_logger()
-    client = boto3.client('s3', region_name='eu-central-1')   
-    client.upload_fileobj(image_file, 'jskramar.materials', image_id, ExtraArgs={'ContentType': 'image/jpg', 'ContentDisposition': 'inline'})
-    logger.info(f"Image uploaded to S3 bucket with key: {image_id}")
+    chunk_size = max(chunk_size, S3_MIN_PART_SIZE)
+    config = TransferConfig(multipart_threshold=chunk_size, multipart_chunksize=chunk_size, max_concurrency=IMAGE_UPLOAD_MAX_CONCURRENCY)
+    response = get_http_client().get(image_url, endpoint='image_download', stream=True, timeout=(HTTP_CONNECT_TIMEOUT, IMAGE_DOWNLOAD_READ_TIMEOUT))
+    with response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        content_type = response.headers.get('Content-Type', 'image/png')
+        body = TeeReader(response.raw, copy_to) if copy_to is not None else response.raw
+        client = get_s3_client()
+        client.upload_fileobj(body, 'jskramar.materials', image_id, ExtraArgs={'ContentType': content_type, 'ContentDisposition': 'inline'}, Config=config)
+    logger.info(f"Image streamed to S3 bucket with key: {image_id} ({content_type})")
     return f"Image uploaded successfully to S3 bucket."
 
 
-def get_secret_value(secret_id : str) -> str:
-    "Retrieves the secret value from AWS Secrets Manager."
-    secrets_manager = boto3.client('secretsmanager', region_name='eu-central-1')
-    try:
-        response = secrets_manager.get_secret_value(SecretId=secret_id)
-        return json.loads(response['SecretString'])
-    except (BotoCoreError, ClientError) as error: # pylint: disable=broad-except, unused-variable
-        pass
+def get_secret_value(secret_id : str) -> dict:
+    "Retrieves the secret value from AWS Secrets Manager. Raises SecretUnavailableError on failure."
+    return get_secret(secret_id)
 
 def initialize_activity_data():
     """
@@ -128,14 +166,27 @@ def load_activity_blueprint_config():
     with open(path, 'r') as file:
         return json.load(file)
 
-def import_activity_data():
+def load_activity_blueprint_batch_config():
+    path = 'config/build_activity_blueprint/batch.json'
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def get_assignee_for_analyst(analyst):
+    "Maps an analyst alias to the roster assignee it teaches as."
+    analyst = (analyst or '').strip().lower()
+    if analyst == 'm-maker25':
+        return 'teacher1'
+    elif analyst == 'cptfreedom':
+        return 'teacher2'
+    return None
+
+def import_activity_data(file_path='data/activity_blueprint.json'):
     "Imports activity data from a JSON file."
     logger = setup_logger()
-    file_path = 'data/activity_blueprint.json'
     try:
         with open(file_path, 'r') as file:
             data = json.load(file)
-            logger.info(f"Activity data imported from {file_path}. Data : {data}")
+            logger.info("Activity data imported from %s. Data : %s", file_path, LogPayload(data))
             if len(data) == 0:
                 raise Exception(f"{file_path} is empty.")
             return data
@@ -143,95 +194,203 @@ def import_activity_data():
         logger.error(f"Error reading {file_path}: {e}")
         return e
 
-def export_activity_blueprint_data(data):
-    "Exports activity data to a JSON file."
+def open_in_dev_editor(file_path):
+    """
+    Development hook: opens the file in the DEV_EDITOR command without waiting for
+    it. Does nothing when DEV_EDITOR is unset, which is the headless default.
+    """
+    if not DEV_EDITOR:
+        return
     logger = setup_logger()
-    file_path = 'data/activity_blueprint.json'
     try:
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-            logger.info(f"Activity data exported to {file_path}")
-            os.system(f"code {file_path}")
+        subprocess.Popen([*shlex.split(DEV_EDITOR), file_path], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    except OSError as e:
+        logger.error(f"Error opening {file_path} in '{DEV_EDITOR}': {e}")
+
+
+def export_activity_blueprint_data(data, file_path='data/activity_blueprint.json', open_in_editor=True):
+    "Atomically exports activity data to a JSON file. `open_in_editor` only applies in dev mode, see open_in_dev_editor."
+    logger = setup_logger()
+    try:
+        write_json_atomic(file_path, data, indent=EXPORT_JSON_INDENT)
+        logger.info(f"Activity data exported to {file_path}")
+        if open_in_editor:
+            open_in_dev_editor(file_path)
     except Exception as e:
         logger.error(f"Error writing {file_path}: {e}")
         return e
 
-def export_activity_data(data):
-    "Exports activity data to a JSON file."
+def export_activity_data(data, file_path='data/activity.json', open_in_editor=True):
+    "Atomically exports activity data to a JSON file. `open_in_editor` only applies in dev mode, see open_in_dev_editor."
     logger = setup_logger()
-    file_path = 'data/activity.json'
     try:
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-            logger.info(f"Activity data exported to {file_path}")
-            os.system(f"code {file_path}")
+        write_json_atomic(file_path, data, indent=EXPORT_JSON_INDENT)
+        logger.info(f"Activity data exported to {file_path}")
+        if open_in_editor:
+            open_in_dev_editor(file_path)
     except Exception as e:
         logger.error(f"Error writing {file_path}: {e}")
         return e
 
 
 def append_activity_data_to_history_dataset(data):
-    "Appends activity data to a JSON dataset."
+    "Appends activity data to the history store, once per activity id, so a retried job does not record it twice."
     logger = setup_logger()
-    file_path = 'data/history.json'
     try:
-        with open(file_path, 'r') as file:
-            dataset = json.load(file)
-            dataset.append(data)
-        with open(file_path, 'w') as file:
-            json.dump(dataset, file, indent=4)
-            logger.info(f"Activity data appended to {file_path}")
+        if get_history_store().get(data.get("id")) is not None:
+            logger.info(f"Activity {data.get('id')} is already in the history store, skipping the append")
+            return None
+        get_history_store().append(data)
+        logger.info(f"Activity data appended to {get_history_store().path}")
     except Exception as e:
-        logger.error(f"Error writing to {file_path}: {e}")
+        logger.error(f"Error appending to the history store: {e}")
         return e
 
-def get_current_slot_record(assignee):
+ROSTER_URL = "https://realspeak.ked.tech/ms_classroom_roster_manager/v1/roster/sem19?school_id=school1"
+ROSTER_CACHE_TTL = 60
+
+_roster_cache_lock = threading.Lock()
+_roster_cache = {"data": None, "fetched_at": None, "etag": None, "last_modified": None}
+
+
+def get_roster(url=ROSTER_URL, ttl=ROSTER_CACHE_TTL):
     """
-    Retrieves the current slot record from the database.
+    Retrieves the parsed roster payload, shared by all slot lookups.
+
+    A cached roster younger than `ttl` seconds is returned as is. Older entries
+    are revalidated with ETag / If-Modified-Since so an unchanged roster costs a
+    304 instead of a full download. The returned payload must not be mutated.
     """
-    url = "https://realspeak.ked.tech/ms_classroom_roster_manager/v1/roster/sem19?school_id=school1"
-    response = requests.get(url)
-    if response.status_code == 200:
-        output = []
-        slots = response.json()[2]
-        now = datetime.now(pytz.utc)
-        # now = datetime.strptime('2024-09-19 15:10:00', "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
+    with _roster_cache_lock:
+        now = time.monotonic()
+        cache = _roster_cache
+        if cache["data"] is not None and now - cache["fetched_at"] < ttl:
+            return cache["data"]
+        headers = {}
+        if cache["data"] is not None:
+            if cache["etag"]:
+                headers["If-None-Match"] = cache["etag"]
+            if cache["last_modified"]:
+                headers["If-Modified-Since"] = cache["last_modified"]
+        response = get_http_client().get(url, endpoint='roster', headers=headers)
+        if response.status_code == 304 and cache["data"] is not None:
+            cache["fetched_at"] = now
+            return cache["data"]
+        if response.status_code == 200:
+            cache["data"] = response.json()
+            cache["fetched_at"] = now
+            cache["etag"] = response.headers.get("ETag")
+            cache["last_modified"] = response.headers.get("Last-Modified")
+            return cache["data"]
+        response.raise_for_status()
+        from requests import HTTPError
+        raise HTTPError(f"Unexpected roster response status: {response.status_code}", response=response)
+
+
+def invalidate_roster_cache():
+    "Drops the cached roster so the next slot lookup fetches it again."
+    with _roster_cache_lock:
+        _roster_cache.update({"data": None, "fetched_at": None, "etag": None, "last_modified": None})
+
+
+def project_slot_record(slot):
+    "Returns a copy of the slot record with students reduced to their public fields."
+    students = [{key: student[key] for key in ['alias', 'first_name', 'last_name', 'date_of_birth'] if key in student} for student in slot['students']]
+    return dict(slot, students=students)
+
+
+class RosterIndex:
+    """
+    Per-assignee index over roster slots.
+
+    Slot times are parsed once into UTC epoch seconds and kept sorted by start
+    time so the active slot is found with a bisect; slots are also bucketed by
+    start date. Slot records are projected once and shared between lookups,
+    so callers must not mutate them.
+    """
+    def __init__(self, slots):
+        self.starts = {}
+        self.intervals = {}
+        self.max_ends = {}
+        self.by_date = {}
+        intervals = {}
         for slot_id, slot in slots.items():
-            start_time = datetime.strptime(slot['start_time'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
-            end_time = datetime.strptime(slot['end_time'], "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
-            if start_time <= now <= end_time and slot['assignee'] == assignee:
-                output.append(slot)
-        if len(output) == 1:
-            for i, student in enumerate(output[0]['students']):
-                output[0]['students'][i] = {key: student[key] for key in ['alias', 'first_name', 'last_name', 'date_of_birth'] if key in student}
-            return output[0]
-        elif len(output) > 1:
-            raise ValueError("Multiple slots match the current date and time.")
-        else:
+            start_time = datetime.strptime(slot['start_time'], "%Y-%m-%d %H:%M:%S")
+            end_time = datetime.strptime(slot['end_time'], "%Y-%m-%d %H:%M:%S")
+            record = project_slot_record(slot)
+            assignee = slot['assignee']
+            start = calendar.timegm(start_time.timetuple())
+            end = calendar.timegm(end_time.timetuple())
+            intervals.setdefault(assignee, []).append((start, end, record))
+            self.by_date.setdefault((assignee, start_time.date()), []).append(record)
+        for assignee, records in intervals.items():
+            records.sort(key=lambda interval: interval[0])
+            max_ends = []
+            max_end = None
+            for start, end, record in records:
+                max_end = end if max_end is None else max(max_end, end)
+                max_ends.append(max_end)
+            self.intervals[assignee] = records
+            self.starts[assignee] = [interval[0] for interval in records]
+            self.max_ends[assignee] = max_ends
+
+    def get_active_slots(self, assignee, now):
+        "Returns the slots of the assignee whose [start, end] interval contains the epoch `now`."
+        starts = self.starts.get(assignee)
+        if not starts:
             return []
+        intervals = self.intervals[assignee]
+        max_ends = self.max_ends[assignee]
+        output = []
+        i = bisect.bisect_right(starts, now) - 1
+        while i >= 0 and max_ends[i] >= now:
+            start, end, record = intervals[i]
+            if end >= now:
+                output.append(record)
+            i -= 1
+        output.reverse()
+        return output
+
+    def get_slots_for_date(self, assignee, date):
+        "Returns the slots of the assignee starting on the given date."
+        return list(self.by_date.get((assignee, date), []))
+
+
+_roster_index_lock = threading.Lock()
+_roster_index = {"source": None, "index": None}
+
+
+def get_roster_index():
+    "Returns the RosterIndex of the current roster, rebuilding it only when the roster changes."
+    roster = get_roster()
+    with _roster_index_lock:
+        if _roster_index["source"] is not roster:
+            _roster_index["index"] = RosterIndex(roster[2])
+            _roster_index["source"] = roster
+        return _roster_index["index"]
+
+
+def get_current_slot_record(assignee):
+    """
+    Retrieves the current slot record from the database.
+    """
+    now = datetime.now(pytz.utc)
+    # now = datetime.strptime('2024-09-19 15:10:00', "%Y-%m-%d %H:%M:%S").replace(tzinfo=pytz.utc)
+    output = get_roster_index().get_active_slots(assignee, now.timestamp())
+    if len(output) == 1:
+        return output[0]
+    elif len(output) > 1:
+        raise ValueError("Multiple slots match the current date and time.")
     else:
-        response.raise_for_status()
+        return []
 
 
 def get_slot_records_for_date(assignee, date='1.1.2024'):
     """
     Retrieves the slot records for a particular date from the database.
     """
-    url = "https://realspeak.ked.tech/ms_classroom_roster_manager/v1/roster/sem19?school_id=school1"
-    response = requests.get(url)
-    if response.status_code == 200:
-        output = []
-        slots = response.json()[2]
-        input_date = datetime.strptime(date, '%d.%m.%Y').date()
-        for slot_id, slot in slots.items():
-            slot_date = datetime.strptime(slot['start_time'], "%Y-%m-%d %H:%M:%S").date()
-            if slot_date == input_date and slot['assignee'] == assignee:
-                for i, student in enumerate(slot['students']):
-                    slot['students'][i] = {key: student[key] for key in ['alias', 'first_name', 'last_name', 'date_of_birth'] if key in student}
-                output.append(slot)
-        return output
-    else:
-        response.raise_for_status()
+    input_date = datetime.strptime(date, '%d.%m.%Y').date()
+    return get_roster_index().get_slots_for_date(assignee, input_date)
 
 def get_slot_weekday(slot_record):
     # here is the value to get it from  since slot is in due date : "due_date": "2024-09-17"
@@ -245,7 +404,7 @@ def get_course_record(course_id):
     Retrieves the course record from the database.
     """
     url = f"https://realspeak.ked.tech/ms_learning_path_manager/v1/course/{course_id}"
-    response = requests.get(url)
+    response = get_http_client().get(url, endpoint='course')
     if response.status_code == 200:
         return response.json()
     else:
@@ -312,14 +471,60 @@ def get_cefr_level(course_record):
     course_name = course_record[2]['learning path']['PRIMARY']['main instruction']['course']
     return course_to_cefr(course_name)
 
-def get_target_vocabulary_json(name) -> dict:
-    path = 'assets/voc_local_db'
-    for file in os.listdir(path):
-        coursework_full_name = format_coursework_id(file.replace('json', ''))
-        name = format_coursework_id(name)
-        if name == coursework_full_name:
-            with open(f'{path}/{file}', 'r') as f:
-                return json.load(f)
+VOC_LOCAL_DB_PATH = 'assets/voc_local_db'
+
+_vocabulary_index_lock = threading.Lock()
+_vocabulary_index = {"path": None, "mtime": None, "files": {}}
+_vocabulary_json_cache = {}
+
+
+def build_vocabulary_index(path=VOC_LOCAL_DB_PATH) -> dict:
+    """
+    Returns a mapping of normalized coursework id to file name for the vocabulary DB.
+
+    The index is built once and rebuilt only when the directory mtime changes,
+    i.e. when units are added, removed or renamed.
+    """
+    mtime = os.stat(path).st_mtime_ns
+    index = _vocabulary_index
+    if index["path"] == path and index["mtime"] == mtime:
+        return index["files"]
+    with _vocabulary_index_lock:
+        if index["path"] == path and index["mtime"] == mtime:
+            return index["files"]
+        files = {}
+        for file in sorted(os.listdir(path)):
+            if not file.endswith('.json'):
+                continue
+            files.setdefault(format_coursework_id(file.replace('json', '')), file)
+        index["files"] = files
+        index["path"] = path
+        index["mtime"] = mtime
+        return files
+
+
+def get_target_vocabulary_json(name, path=VOC_LOCAL_DB_PATH) -> dict:
+    """
+    Retrieves the vocabulary JSON for a coursework name from the local vocabulary DB.
+
+    Parsed files are cached and reloaded when their mtime changes. The returned
+    dictionary is shared between callers and must not be mutated.
+    """
+    file = build_vocabulary_index(path).get(format_coursework_id(name))
+    if file is None:
+        return None
+    file_path = f'{path}/{file}'
+    try:
+        mtime = os.stat(file_path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _vocabulary_json_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+    _vocabulary_json_cache[file_path] = (mtime, data)
+    return data
 
 def get_target_material(course_record, assignee, weekday):
     """
@@ -341,6 +546,12 @@ def get_target_vocabulary(course_record, assignee, weekday):
     """
     print("RUNNING GET TARGET VOCABULARY")
     target_material = get_target_material(course_record, assignee, weekday)
+    return get_target_vocabulary_for_material(target_material)
+
+def get_target_vocabulary_for_material(target_material):
+    """
+    Retrieves the target vocabulary for already resolved target material.
+    """
     print(target_material, "TARGET MATERIAL")
     target_vocabulary = []
     for material in target_material:
@@ -350,9 +561,18 @@ def get_target_vocabulary(course_record, assignee, weekday):
         target_vocabulary.append(target_vocabulary_json)
     return target_vocabulary
 
-def get_random_itoken(student_alias: str, itokens: list):
+def make_prompt_rng(*inputs) -> random.Random:
+    """
+    Returns a random generator seeded from the activity inputs, such as the slot and
+    the target material. The same inputs then always assemble the same prompt, so
+    re-running a blueprint hits the completion cache.
     """
-    Retrieves a random iToken for the student.
+    encoded = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str)
+    return random.Random(hashlib.sha256(encoded.encode('utf-8')).hexdigest())
+
+def get_random_itoken(student_alias: str, itokens: list, rng=random):
+    """
+    Retrieves a random iToken for the student, drawn from `rng`.
     """
     data_point = ""
 
@@ -363,17 +583,17 @@ def get_random_itoken(student_alias: str, itokens: list):
         return data_point
 
     # Randomly select one of the top-level categories
-    top_level_token = random.choice(student_itokens)
+    top_level_token = rng.choice(student_itokens)
 
     # Recursive function to traverse the structure and get a random data point
     def get_random_from_dict_or_list(data):
         if isinstance(data, dict):
             # If the data is a dictionary, randomly pick one of its keys
-            key = random.choice(list(data.keys()))
+            key = rng.choice(list(data.keys()))
             return get_random_from_dict_or_list(data[key])
         elif isinstance(data, list):
             # If the data is a list, randomly pick an item from the list
-            return random.choice(data)
+            return rng.choice(data)
         else:
             # If it's neither a dict nor a list, return the value directly
             return data
@@ -382,13 +602,35 @@ def get_random_itoken(student_alias: str, itokens: list):
 
     return data_point
 
-def make_activity_prompt(prompt: dict, target_vocabulary: list, data_point, personalize : bool,  students: list):
+# Static part of the activity prompt. It is kept byte-identical across activities and
+# placed before every per-activity detail so the provider's prefix caching applies.
+ACTIVITY_PROMPT_PREFIX = (
+    "Please generate a short reading activity containing a brief paragraph of text (100 seconds reading time) based on the activity details listed at the end of this message.\n"
+    "\nThe expected output should be in the following JSON format:\n"
+    "{\n"
+    "    \"media\": {\n"
+    "        \"style\": \"<Describe the best style of image that visually represents the scenario here>\"\n"
+    "    },\n"
+    "    \"sentence\": \"<The reading activity text goes here>\",\n"
+    "    \"questions\": {\n"
+    "        \"1\": { \"sentence\": \"<Question 1 text goes here>\", \"answer\": \"<Question 1 answer goes here>\" },\n"
+    "        \"2\": { \"sentence\": \"<Question 2 text goes here>\", \"answer\": \"<Question 2 answer goes here>\" },\n"
+    "        \"3\": { \"sentence\": \"<Question 3 text goes here>\", \"answer\": \"<Question 3 answer goes here>\" }\n"
+    "    }\n"
+    "}\n"
+    "\nActivity details:\n"
+)
+
+def make_activity_prompt(prompt: dict, target_vocabulary: list, data_point, personalize : bool,  students: list, rng=random):
     """
     Generates a single string prompt that describes the activity, integrates target vocabulary, 
     personalized iTokens, and provides an explanation of the expected JSON output format.
+
+    The prompt starts with the static ACTIVITY_PROMPT_PREFIX; everything that varies per
+    activity is appended after it. The vocabulary is drawn from `rng`.
     """
-    # Step 1: Initialize the prompt string
-    activity_prompt = "Please generate a short reading activity containing a brief paragraph of text (100 seconds reading time) based on the following details:\n\n: "
+    # Step 1: Start with the static instructions and the expected JSON output format
+    activity_prompt = ACTIVITY_PROMPT_PREFIX
     
     # Step 2: Include student names if required
     if prompt.get("include_ss"):
@@ -401,26 +643,11 @@ def make_activity_prompt(prompt: dict, target_vocabulary: list, data_point, pers
         activity_prompt += f"The central theme of the activity is: \"{custom_premise}\"\n"
     
     # Step 4: Select and include random vocabulary words
-    selected_vocabulary = random.sample(target_vocabulary, min(5, len(target_vocabulary)))
+    selected_vocabulary = rng.sample(target_vocabulary, min(5, len(target_vocabulary)))
     activity_prompt += f"The following vocabulary words should be included and practiced: {', '.join(selected_vocabulary)}.\n"
     
     # Step 5: Personalize using iTokens if 'personalize' is true
     if personalize and data_point:
         activity_prompt += f"The scenario should be personalized around the topic \"{data_point}\", which evokes its provided description.\n"
     
-    # Step 6: Explain the expected JSON output format
-    activity_prompt += (
-        "\nThe expected output should be in the following JSON format:\n"
-        "{\n"
-        "    \"media\": {\n"
-        "        \"style\": \"<Describe the best style of image that visually represents the scenario here>\"\n"
-        "    },\n"
-        "    \"sentence\": \"<The reading activity text goes here>\",\n"
-        "    \"questions\": {\n"
-        "        \"1\": \"{ \"sentence\": \"<Question 1 text goes here>\", \"answer\": \"<Question 1 answer goes here>\"  }\",\n"
-        "        \"2\": \"{ \"sentence\": \"<Question 2 text goes here>\", \"answer\": \"<Question 2 answer goes here>\"  }\",\n"
-        "        \"3\": \"{ \"sentence\": \"<Question 3 text goes here>\", \"answer\": \"<Question 3 answer goes here>\"  }\"\n"
-        "    }\n"
-        "}\n"
-    )
-    return activity_prompt
\ No newline at end of file
+    return activity_prompt
@@ -0,0 +1,240 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the append-only, indexed store of built activities.
+
+Import the legacy data/history.json once with:
+    - python -m backend.history_store
+"""
+
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+HISTORY_DB_PATH = os.environ.get('HISTORY_DB_PATH', 'data/history.sqlite3')
+LEGACY_HISTORY_PATH = 'data/history.json'
+HISTORY_PAGE_SIZE = 50
+HISTORY_FETCH_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    activity_id TEXT,
+    group_alias TEXT,
+    cefr_level TEXT,
+    analyst TEXT,
+    date TEXT,
+    created_at REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_activity_id ON history (activity_id, seq);
+CREATE INDEX IF NOT EXISTS history_group_alias ON history (group_alias, seq);
+CREATE INDEX IF NOT EXISTS history_cefr_level ON history (cefr_level, seq);
+CREATE INDEX IF NOT EXISTS history_analyst ON history (analyst, seq);
+CREATE INDEX IF NOT EXISTS history_date ON history (date, seq);
+CREATE TABLE IF NOT EXISTS history_vocabulary (
+    seq INTEGER NOT NULL,
+    word TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_vocabulary_word ON history_vocabulary (word, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def normalize_vocabulary_word(word) -> str:
+    return str(word).strip().lower()
+
+
+def get_history_vocabulary(data: dict) -> list:
+    "Returns the distinct, normalized target vocabulary words of an activity record."
+    words = []
+    for word in data.get("target_vocabulary") or []:
+        word = normalize_vocabulary_word(word)
+        if word and word not in words:
+            words.append(word)
+    return words
+
+
+def get_history_index_fields(data: dict) -> dict:
+    "Extracts the indexed columns of an activity record. The date is the day of its sandbox slot."
+    metadata = data.get("metadata") or {}
+    sandbox_slot = metadata.get("sandbox_slot") or {}
+    date = sandbox_slot.get("due_date") or (sandbox_slot.get("start_time") or "")[:10] or None
+    return {
+        "activity_id": data.get("id"),
+        "group_alias": data.get("group_alias"),
+        "cefr_level": data.get("cefr_level"),
+        "analyst": metadata.get("analyst"),
+        "date": date
+    }
+
+
+class HistoryStore:
+    """
+    SQLite-backed history of built activities.
+
+    Every append is a single-row INSERT: O(1) regardless of the history size
+    and atomic under concurrent writers. Records are indexed by activity id,
+    group alias, CEFR level, analyst, date and target vocabulary word. The
+    sequence number gives the append order and is the pagination cursor.
+    """
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def insert(self, connection, data, created_at):
+        fields = get_history_index_fields(data)
+        cursor = connection.execute(
+            "INSERT INTO history (activity_id, group_alias, cefr_level, analyst, date, created_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (fields["activity_id"], fields["group_alias"], fields["cefr_level"], fields["analyst"], fields["date"], created_at, json.dumps(data))
+        )
+        words = get_history_vocabulary(data)
+        if words:
+            connection.executemany("INSERT INTO history_vocabulary (seq, word) VALUES (?, ?)", [(cursor.lastrowid, word) for word in words])
+
+    def append(self, data: dict):
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                self.insert(connection, data, time.time())
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+
+    def query(self, filters=None, cursor=None, limit=HISTORY_PAGE_SIZE):
+        """
+        Yields (seq, data JSON string) for records matching `filters`, newest first.
+
+        Supported filters are group_alias, cefr_level, analyst, date_from and
+        date_to (inclusive, YYYY-MM-DD), and word, a target vocabulary word.
+        `cursor` is the seq of the last record of the previous page. Rows are read
+        from an index-backed SQL cursor in small batches, so memory stays flat
+        whatever the size of the history.
+        """
+        filters = filters or {}
+        conditions = []
+        parameters = []
+        for column in ["group_alias", "cefr_level", "analyst"]:
+            if filters.get(column):
+                conditions.append(f"{column} = ?")
+                parameters.append(filters[column])
+        if filters.get("date_from"):
+            conditions.append("date >= ?")
+            parameters.append(filters["date_from"])
+        if filters.get("date_to"):
+            conditions.append("date <= ?")
+            parameters.append(filters["date_to"])
+        if filters.get("word"):
+            conditions.append("seq IN (SELECT seq FROM history_vocabulary WHERE word = ?)")
+            parameters.append(normalize_vocabulary_word(filters["word"]))
+        if cursor is not None:
+            conditions.append("seq < ?")
+            parameters.append(int(cursor))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        parameters.append(int(limit))
+        with self.connect() as connection:
+            rows = connection.execute(f"SELECT seq, data FROM history {where} ORDER BY seq DESC LIMIT ?", parameters)
+            while True:
+                batch = rows.fetchmany(HISTORY_FETCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    yield row["seq"], row["data"]
+
+    def get(self, activity_id):
+        "Returns the latest record appended for the activity id, or None."
+        with self.connect() as connection:
+            row = connection.execute("SELECT data FROM history WHERE activity_id = ? ORDER BY seq DESC LIMIT 1", (activity_id,)).fetchone()
+        return json.loads(row["data"]) if row is not None else None
+
+    def migrate_legacy_history(self, legacy_path=LEGACY_HISTORY_PATH) -> int:
+        """
+        Imports the legacy JSON history once, in its original order and in a single
+        transaction. Returns the number of imported records; 0 once already migrated.
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                migrated = connection.execute("SELECT value FROM meta WHERE key = 'legacy_history_migrated'").fetchone()
+                if migrated is not None or not os.path.exists(legacy_path):
+                    connection.execute("COMMIT")
+                    return 0
+                with open(legacy_path, 'r') as file:
+                    dataset = json.load(file)
+                # Legacy records carry no append time; they keep their order through seq.
+                for data in dataset:
+                    self.insert(connection, data, None)
+                connection.execute("INSERT INTO meta (key, value) VALUES ('legacy_history_migrated', ?)", (str(time.time()),))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(dataset)
+
+    def index_vocabulary(self) -> int:
+        """
+        Fills the vocabulary index for records appended before it existed, once.
+        Returns the number of indexed records; 0 once already indexed.
+        """
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                indexed = connection.execute("SELECT value FROM meta WHERE key = 'vocabulary_indexed'").fetchone()
+                if indexed is not None:
+                    connection.execute("COMMIT")
+                    return 0
+                rows = connection.execute("SELECT seq, data FROM history WHERE seq NOT IN (SELECT seq FROM history_vocabulary)").fetchall()
+                for row in rows:
+                    words = get_history_vocabulary(json.loads(row["data"]))
+                    connection.executemany("INSERT INTO history_vocabulary (seq, word) VALUES (?, ?)", [(row["seq"], word) for word in words])
+                connection.execute("INSERT INTO meta (key, value) VALUES ('vocabulary_indexed', ?)", (str(time.time()),))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return len(rows)
+
+
+_history_store = None
+_history_store_lock = threading.Lock()
+
+
+def get_history_store() -> HistoryStore:
+    "Returns the process-wide HistoryStore, importing the legacy history on first use."
+    global _history_store
+    if _history_store is None:
+        with _history_store_lock:
+            if _history_store is None:
+                store = HistoryStore()
+                store.migrate_legacy_history()
+                store.index_vocabulary()
+                _history_store = store
+    return _history_store
+
+
+if __name__ == '__main__':
+    imported = HistoryStore().migrate_legacy_history()
+    print(f"Imported {imported} records from {LEGACY_HISTORY_PATH} into {HISTORY_DB_PATH}.")
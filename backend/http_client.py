@@ -0,0 +1,159 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the shared HTTP client used to talk to the roster and course services.
+"""
+
+
+import os
+import time
+import atexit
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '20'))
+HTTP_POOL_CONNECTIONS = int(os.environ.get('HTTP_POOL_CONNECTIONS', '4'))
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '16'))
+# Every process flushes its latency counters here, next to the job queue, so the web
+# app can report the requests made by the job workers too.
+HTTP_STATS_PATH = os.environ.get('HTTP_STATS_PATH', 'data/jobs.sqlite3')
+HTTP_STATS_FLUSH_SECONDS = float(os.environ.get('HTTP_STATS_FLUSH_SECONDS', '10'))
+
+HTTP_STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS http_latency (
+    process TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    total_seconds REAL NOT NULL,
+    max_seconds REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (process, endpoint)
+);
+"""
+
+
+@contextmanager
+def connect_stats(path=HTTP_STATS_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    try:
+        connection.executescript(HTTP_STATS_SCHEMA)
+        yield connection
+    finally:
+        connection.close()
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client with a bounded connection pool and default timeouts.
+
+    Every request is attributed to an endpoint name and its latency is recorded,
+    so slow upstream services show up in get_latency_stats(). The counters are
+    flushed to `stats_path` at most every `stats_flush_seconds`, where
+    get_process_latency_stats() adds them up across processes.
+    """
+    def __init__(self, connect_timeout=HTTP_CONNECT_TIMEOUT, read_timeout=HTTP_READ_TIMEOUT,
+                 pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE,
+                 stats_path=HTTP_STATS_PATH, stats_flush_seconds=HTTP_STATS_FLUSH_SECONDS):
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.latency = {}
+        self.lock = threading.Lock()
+        self.stats_path = stats_path
+        self.stats_flush_seconds = stats_flush_seconds
+        self.flushed_at = time.monotonic()
+
+    def request(self, method, url, endpoint=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint or url
+        started = time.perf_counter()
+        failed = False
+        try:
+            return self.session.request(method, url, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.record_latency(endpoint, time.perf_counter() - started, failed)
+
+    def get(self, url, endpoint=None, **kwargs):
+        return self.request('GET', url, endpoint=endpoint, **kwargs)
+
+    def record_latency(self, endpoint, seconds, failed=False):
+        with self.lock:
+            stats = self.latency.setdefault(endpoint, {"count": 0, "errors": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["errors"] += int(failed)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+            flush = time.monotonic() - self.flushed_at >= self.stats_flush_seconds
+        if flush:
+            self.flush_latency_stats()
+
+    def get_latency_stats(self):
+        "Returns a snapshot of the per-endpoint latency counters, including the mean latency."
+        with self.lock:
+            return {
+                endpoint: dict(stats, mean_seconds=stats["total_seconds"] / stats["count"])
+                for endpoint, stats in self.latency.items()
+            }
+
+    def flush_latency_stats(self):
+        "Writes this process's counters to the stats database. Stats are best effort: errors are ignored."
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            rows = [(f"{socket.gethostname()}:{os.getpid()}", endpoint, stats["count"], stats["errors"], stats["total_seconds"], stats["max_seconds"], time.time())
+                    for endpoint, stats in self.latency.items()]
+        if not rows:
+            return
+        try:
+            with connect_stats(self.stats_path) as connection:
+                connection.executemany("INSERT OR REPLACE INTO http_latency VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error:
+            pass
+
+
+def get_process_latency_stats(path=HTTP_STATS_PATH) -> dict:
+    "Returns the per-endpoint latency counters flushed by every process, added up, including the mean latency."
+    with connect_stats(path) as connection:
+        rows = connection.execute(
+            "SELECT endpoint, SUM(count), SUM(errors), SUM(total_seconds), MAX(max_seconds), COUNT(*) FROM http_latency GROUP BY endpoint ORDER BY endpoint"
+        ).fetchall()
+    return {
+        endpoint: {"count": count, "errors": errors, "total_seconds": total_seconds, "max_seconds": max_seconds,
+                   "mean_seconds": total_seconds / count if count else 0.0, "processes": processes}
+        for endpoint, count, errors, total_seconds, max_seconds, processes in rows
+    }
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    "Returns the process-wide HttpClient instance."
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = HttpClient()
+                atexit.register(_http_client.flush_latency_stats)
+    return _http_client
+
+
+def flush_http_latency_stats():
+    "Flushes the counters of this process's HttpClient, if it made any requests."
+    if _http_client is not None:
+        _http_client.flush_latency_stats()
@@ -0,0 +1,61 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the prompt-keyed cache that lets unchanged activities reuse their generated image.
+"""
+
+
+import os
+import json
+import hashlib
+import threading
+from backend.workspace import write_json_atomic
+
+
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'data/cache/images')
+
+
+class ImageCache:
+    """
+    Maps the SHA-256 of an image generation request (model, prompt, size and
+    quality) to the S3 image it produced and its responsive variants. Entries are
+    a few hundred bytes each and the images they point to are never deleted, so
+    the cache is not bounded.
+    """
+    def __init__(self, directory=IMAGE_CACHE_DIR):
+        self.directory = directory
+
+    @staticmethod
+    def make_key(model, prompt, size, quality) -> str:
+        payload = {"model": model, "prompt": prompt, "size": size, "quality": quality}
+        encoded = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        "Returns the cached entry with its image_key, image_src and image_srcset, or None."
+        try:
+            with open(self.path(key), 'r') as file:
+                entry = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if entry.get("image_src") else None
+
+    def put(self, key, image_key, image_src, image_srcset=None):
+        write_json_atomic(self.path(key), {"key": key, "image_key": image_key, "image_src": image_src, "image_srcset": image_srcset}, indent=None)
+
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache() -> ImageCache:
+    "Returns the process-wide ImageCache."
+    global _image_cache
+    if _image_cache is None:
+        with _image_cache_lock:
+            if _image_cache is None:
+                _image_cache = ImageCache()
+    return _image_cache
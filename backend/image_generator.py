@@ -4,18 +4,23 @@ Email : peter@ked.tech
 This module contains a function that generates an image based on a given sentence and target vocabulary and grammar.
 """
 
-import io
-import requests
 import os
-from openai import OpenAI
-from backend.helpers import upload_image_to_s3, get_secret_value
+import tempfile
+from backend.helpers import stream_image_to_s3
+from backend.image_variants import generate_image_variants, MATERIALS_BUCKET_URL
+from backend.image_cache import get_image_cache
+from backend.clients import call_openai
+from backend.rate_limiter import get_rate_limiter
 from backend.helpers import setup_logger
 
 
 class ImageGenerator:
     def __init__(self, activity_data):
         self.activity_data = activity_data
+        self.image_model = "dall-e-3"
         self.image_size = "1792x1024"
+        self.image_quality = "hd"
+        self.image_srcset = None
         self.logger = setup_logger()
          
     def craft_prompt(self):
@@ -32,28 +37,47 @@ class ImageGenerator:
         )
         return prompt
 
-    def generate_image(self, image_id):
+    def generate_image(self, image_id, force_regenerate=False):
+        """
+        Returns the S3 URL of the image for the activity. An image already generated
+        from the same prompt, size and quality is reused unless `force_regenerate`.
+        """
         try:
             self.logger.info(f"{self.__class__.__name__}: Invoking 'generate_image' method for image generation.")
-            key= get_secret_value('openai_key')['openai_key']
-            client = OpenAI(api_key=key)
             prompt = self.craft_prompt()
-            response = client.images.generate(
-            model="dall-e-3",
+            image_cache = get_image_cache()
+            cache_key = image_cache.make_key(self.image_model, prompt, self.image_size, self.image_quality)
+            if not force_regenerate:
+                cached = image_cache.get(cache_key)
+                if cached is not None:
+                    self.image_srcset = cached.get("image_srcset")
+                    self.logger.info(f"{self.__class__.__name__}: Reusing image {cached['image_key']} generated from the same prompt.")
+                    return cached["image_src"]
+            response = get_rate_limiter('images').call(lambda: call_openai(lambda client: client.images.generate(
+            model=self.image_model,
             prompt=prompt,
             size=self.image_size,
-            quality="hd",
+            quality=self.image_quality,
             n=1,
-            )
+            )))
             image_url = response.data[0].url
-            img_data = requests.get(image_url).content
-            # Use an in-memory bytes buffer to avoid saving to disk
-            image_file = io.BytesIO(img_data)
-            image_file.name = f"{image_id}.jpg"
             self.logger.info(f"{self.__class__.__name__}: Image generated successfully.")
-            upload_image_to_s3(image_file, image_id)
-            image_url = 'https://s3.eu-central-1.amazonaws.com/jskramar.materials/' + image_id
+            # The original is spooled to disk while it streams to S3, so the variants
+            # are encoded from the local copy without a second download.
+            with tempfile.NamedTemporaryFile(suffix='.img') as spool:
+                stream_image_to_s3(image_url, image_id, copy_to=spool)
+                spool.flush()
+                self.make_image_variants(spool.name, image_id)
+            image_url = MATERIALS_BUCKET_URL + image_id
+            image_cache.put(cache_key, image_id, image_url, self.image_srcset)
             return image_url
         except Exception as e:
             self.logger.error(f"{self.__class__.__name__}: Error generating image: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    def make_image_variants(self, source_path, image_id):
+        "Sets `image_srcset` to the responsive variants of the image. The original stays usable if this fails."
+        try:
+            self.image_srcset = generate_image_variants(source_path, image_id)
+        except Exception as e:
+            self.logger.error(f"{self.__class__.__name__}: Error generating image variants: {e}")
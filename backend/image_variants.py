@@ -0,0 +1,71 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the generation of the responsive, compressed variants of activity images.
+"""
+
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from backend.clients import get_s3_client
+from backend.helpers import setup_logger
+
+
+MATERIALS_BUCKET = 'jskramar.materials'
+MATERIALS_BUCKET_URL = f'https://s3.eu-central-1.amazonaws.com/{MATERIALS_BUCKET}/'
+IMAGE_VARIANT_WIDTHS = [int(width) for width in os.environ.get('IMAGE_VARIANT_WIDTHS', '480,960,1440').split(',')]
+IMAGE_VARIANT_MAX_WORKERS = int(os.environ.get('IMAGE_VARIANT_MAX_WORKERS', '4'))
+IMAGE_VARIANT_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Listed in order of preference: browsers pick the first <source> type they support.
+IMAGE_VARIANT_FORMATS = {
+    "image/webp": {"format": "WEBP", "extension": "webp", "options": {"quality": 75, "method": 4}},
+    "image/jpeg": {"format": "JPEG", "extension": "jpg", "options": {"quality": 80, "optimize": True, "progressive": True}},
+}
+
+
+def get_image_variant_key(image_id, width, content_type) -> str:
+    return f"{image_id}_{width}w.{IMAGE_VARIANT_FORMATS[content_type]['extension']}"
+
+
+def make_image_variant(source_path, width, content_type) -> bytes:
+    "Returns the image at `source_path` scaled down to `width` pixels and encoded as `content_type`."
+    from PIL import Image
+    variant_format = IMAGE_VARIANT_FORMATS[content_type]
+    with Image.open(source_path) as image:
+        image = image.convert('RGB')
+        if image.width > width:
+            image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+        buffer = io.BytesIO()
+        image.save(buffer, variant_format["format"], **variant_format["options"])
+    return buffer.getvalue()
+
+
+def upload_image_variant(source_path, image_id, width, content_type) -> str:
+    key = get_image_variant_key(image_id, width, content_type)
+    body = make_image_variant(source_path, width, content_type)
+    get_s3_client().put_object(Bucket=MATERIALS_BUCKET, Key=key, Body=body, ContentType=content_type,
+                               ContentDisposition='inline', CacheControl=IMAGE_VARIANT_CACHE_CONTROL)
+    return MATERIALS_BUCKET_URL + key
+
+
+def generate_image_variants(source_path, image_id, widths=None, max_workers=IMAGE_VARIANT_MAX_WORKERS) -> dict:
+    """
+    Encodes every width of IMAGE_VARIANT_WIDTHS in every format of IMAGE_VARIANT_FORMATS
+    and uploads them next to the original image. Pillow releases the GIL while
+    resizing and encoding, so the variants are produced in parallel on a thread pool.
+
+    Returns a srcset map keyed by content type, ready for a <picture> <source>:
+        {"image/webp": "<url> 480w, <url> 960w, ...", "image/jpeg": "..."}
+    """
+    logger = setup_logger()
+    widths = sorted(widths or IMAGE_VARIANT_WIDTHS)
+    variants = [(width, content_type) for content_type in IMAGE_VARIANT_FORMATS for width in widths]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        urls = list(executor.map(lambda variant: upload_image_variant(source_path, image_id, *variant), variants))
+    srcset = {}
+    for (width, content_type), url in zip(variants, urls):
+        srcset.setdefault(content_type, []).append(f"{url} {width}w")
+    logger.info(f"Uploaded {len(variants)} variants of image {image_id}: widths {widths}, formats {list(IMAGE_VARIANT_FORMATS)}")
+    return {content_type: ", ".join(entries) for content_type, entries in srcset.items()}
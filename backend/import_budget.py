@@ -0,0 +1,74 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the check of the web app's cold-start import time.
+
+The web app runs on scale-to-zero containers, so importing app.py must stay cheap:
+the generation stack and the heavy client libraries are imported on first use.
+Run the check after touching imports with:
+    - python -m backend.import_budget
+It exits with status 1 when the budget is exceeded or a heavy module is imported.
+"""
+
+
+import os
+import sys
+import json
+import subprocess
+
+
+IMPORT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', '500'))
+IMPORT_BUDGET_RUNS = 3
+
+# Modules the proxy routes ('/data', '/course', '/history', '/jobs') must not import.
+HEAVY_MODULES = [
+    "openai",
+    "boto3",
+    "botocore",
+    "requests",
+    "cefrpy",
+    "PIL",
+    "backend.activity_blueprint_service",
+    "backend.activity_blueprint_batch_service",
+    "backend.activity_blueprint_builder",
+    "backend.activity_service",
+    "backend.activity_builder",
+    "backend.image_generator",
+    "backend.text_analyzer",
+]
+
+PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({"import_ms": import_ms, "heavy_modules": [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def measure_app_import() -> dict:
+    "Imports app.py in a fresh interpreter and returns the import time and the heavy modules it loaded."
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=root, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def check_import_budget(budget_ms=IMPORT_BUDGET_MS, runs=IMPORT_BUDGET_RUNS) -> list:
+    "Returns the budget violations, an empty list when the app imports within budget. The fastest of `runs` counts."
+    measurements = [measure_app_import() for _ in range(runs)]
+    fastest = min(measurement["import_ms"] for measurement in measurements)
+    problems = []
+    if fastest > budget_ms:
+        problems.append(f"Importing app.py took {fastest:.0f} ms, over the {budget_ms:.0f} ms budget.")
+    heavy_modules = sorted({module for measurement in measurements for module in measurement["heavy_modules"]})
+    if heavy_modules:
+        problems.append(f"Importing app.py loaded modules that must be imported on first use: {', '.join(heavy_modules)}.")
+    print(f"app.py import time: {fastest:.0f} ms (budget {budget_ms:.0f} ms)")
+    return problems
+
+
+if __name__ == '__main__':
+    problems = check_import_budget()
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
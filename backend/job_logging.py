@@ -0,0 +1,133 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the non-blocking, structured logging pipeline behind the job logger.
+"""
+
+
+import os
+import json
+import queue
+import atexit
+import threading
+import contextvars
+import logging
+from datetime import datetime, timezone
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+
+
+LOG_FILE_PATH = os.environ.get('LOG_FILE_PATH', 'data/logs/job.log')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '5'))
+LOG_PAYLOAD_MAX_CHARS = int(os.environ.get('LOG_PAYLOAD_MAX_CHARS', '2000'))
+
+_log_context = contextvars.ContextVar('log_context', default={})
+_payload_encoder = json.JSONEncoder(ensure_ascii=False, default=str)
+
+_lock = threading.Lock()
+_log_queue = None
+_listener = None
+_listener_pid = None
+
+
+@contextmanager
+def bind_log_context(**fields):
+    "Adds `fields`, such as the job id, to every record logged in the current context."
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def get_log_context() -> dict:
+    return _log_context.get()
+
+
+class LogPayload:
+    """
+    Wraps an object passed as a lazy logging argument. It is only rendered if the
+    record is emitted, as JSON cut off after `max_chars` characters; encoding stops
+    there, so logging a large dict costs the same as logging a short one.
+    """
+    __slots__ = ('value', 'max_chars')
+
+    def __init__(self, value, max_chars=LOG_PAYLOAD_MAX_CHARS):
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self):
+        chunks = []
+        size = 0
+        for chunk in _payload_encoder.iterencode(self.value):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > self.max_chars:
+                return f"{''.join(chunks)[:self.max_chars]}... [truncated]"
+        return ''.join(chunks)
+
+
+class LogContextFilter(logging.Filter):
+    "Attaches the context bound with bind_log_context to the record on the emitting thread."
+    def filter(self, record):
+        record.context = _log_context.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    "Formats records as one JSON object per line, including their bound context."
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def get_log_file_path(pid=None) -> str:
+    """
+    Returns this process's log file, e.g. data/logs/job.<pid>.log. Each process
+    rotates only its own file, as RotatingFileHandler is not multiprocess-safe.
+    """
+    root, extension = os.path.splitext(LOG_FILE_PATH)
+    return f"{root}.{pid or os.getpid()}{extension}"
+
+
+def configure_queue_logging(logger, make_handlers, filters=()):
+    """
+    Routes `logger` through an in-memory queue, once per process. The emitting
+    thread only renders the message and enqueues the record; the handlers returned
+    by `make_handlers()` format and write it on a background listener thread.
+    A forked worker process gets its own queue and listener.
+    """
+    global _log_queue, _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        _log_queue = queue.Queue()
+        _listener = QueueListener(_log_queue, *make_handlers(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+        queue_handler = QueueHandler(_log_queue)
+        queue_handler.addFilter(LogContextFilter())
+        for log_filter in filters:
+            queue_handler.addFilter(log_filter)
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        atexit.register(_listener.stop)
+
+
+def flush_logs():
+    "Blocks until every record enqueued so far in this process has been written."
+    if _log_queue is not None and _listener_pid == os.getpid():
+        _log_queue.join()
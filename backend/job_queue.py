@@ -0,0 +1,169 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the durable SQLite-backed job queue used by the '/baba' and '/build' routes.
+"""
+
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+from contextlib import contextmanager
+
+
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', 'data/jobs.sqlite3')
+JOB_LEASE_SECONDS = 120
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_BACKOFF_SECONDS = float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', '30'))
+JOB_MAX_RETRY_BACKOFF_SECONDS = float(os.environ.get('JOB_MAX_RETRY_BACKOFF_SECONDS', '600'))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    stages TEXT NOT NULL DEFAULT '{}',
+    result TEXT,
+    error TEXT,
+    available_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+class JobQueue:
+    """
+    Job queue persisted in SQLite so jobs survive dropped connections and restarts.
+
+    Workers lease a job for JOB_LEASE_SECONDS and must heartbeat to keep it.
+    A job whose lease expires, because its worker died, is handed to the next
+    worker. A failed job is retried until it has been attempted max_attempts times,
+    after an exponential backoff starting at `retry_backoff_seconds`. Each attempt
+    starts with empty stages.
+    """
+    def __init__(self, path=JOB_QUEUE_PATH, lease_seconds=JOB_LEASE_SECONDS,
+                 retry_backoff_seconds=JOB_RETRY_BACKOFF_SECONDS, max_retry_backoff_seconds=JOB_MAX_RETRY_BACKOFF_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self.max_retry_backoff_seconds = max_retry_backoff_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            columns = [row["name"] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if "available_at" not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN available_at REAL")
+
+    @contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, job_type, payload=None, max_attempts=JOB_MAX_ATTEMPTS) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, type, payload, status, max_attempts, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload or {}), max_attempts, now, now)
+            )
+        return job_id
+
+    def lease(self, worker_id):
+        """
+        Claims the oldest runnable job for the worker, or returns None when there is
+        none. The stages of the previous attempt are cleared and returned as
+        `previous_stages`, so a handler can skip side effects that already completed.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'Lease expired on the last attempt', lease_owner = NULL, updated_at = ? WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+                    (now, now)
+                )
+                row = connection.execute(
+                    "SELECT id, stages FROM jobs WHERE attempts < max_attempts AND ((status = 'queued' AND (available_at IS NULL OR available_at <= ?)) OR (status = 'running' AND lease_expires_at < ?)) ORDER BY created_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', attempts = attempts + 1, stages = '{}', available_at = NULL, lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE id = ?",
+                        (worker_id, now + self.lease_seconds, now, row["id"])
+                    )
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        job = self.get(row["id"])
+        job["previous_stages"] = json.loads(row["stages"])
+        return job
+
+    def heartbeat(self, job_id, worker_id) -> bool:
+        "Extends the lease. Returns False if the worker no longer owns the job."
+        now = time.time()
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires_at = ?, updated_at = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (now + self.lease_seconds, now, job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+
+    def update_stage(self, job_id, stage, status):
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET stages = json_set(stages, '$.' || ?, ?), updated_at = ? WHERE id = ?",
+                (stage, status, now, job_id)
+            )
+
+    def complete(self, job_id, worker_id, result=None):
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (json.dumps(result), now, job_id, worker_id)
+            )
+
+    def fail(self, job_id, worker_id, error):
+        """
+        Records the error and requeues the job, available again after the backoff of
+        its attempt, or marks it failed once its attempts are used up.
+        """
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "available_at = CASE WHEN attempts < max_attempts THEN ? + min(?, ? * (1 << (attempts - 1))) END, error = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                (now, self.max_retry_backoff_seconds, self.retry_backoff_seconds, str(error), now, job_id, worker_id)
+            )
+
+    def get(self, job_id):
+        with self.connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["stages"] = json.loads(job["stages"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
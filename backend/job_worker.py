@@ -0,0 +1,131 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the worker processes that run the queued '/baba', '/baba/batch' and '/build' jobs.
+
+Start a pool of workers next to the web app with:
+    - python -m backend.job_worker --workers 4
+"""
+
+
+import os
+import time
+import socket
+import argparse
+import threading
+import multiprocessing
+from backend.job_queue import JobQueue
+from backend.activity_blueprint_service import ActivityBlueprintService
+from backend.activity_service import ActivityService
+from backend.activity_blueprint_batch_service import ActivityBlueprintBatchService
+from backend.workspace import JobWorkspace
+from backend.helpers import setup_logger
+from backend.job_logging import bind_log_context
+from backend.http_client import flush_http_latency_stats
+
+
+JOB_POLL_SECONDS = 1.0
+
+
+def run_activity_blueprint_job(job, on_step):
+    service = ActivityBlueprintService(workspace=JobWorkspace(job["payload"]["activity_id"]))
+    activity = service.build_activity_blueprint(on_step=on_step)
+    return {"activity_id": activity.id}
+
+
+def run_activity_job(job, on_step):
+    # A retry reuses the image an earlier attempt already generated and cached,
+    # instead of paying for, and uploading, another one.
+    force_regenerate_image = bool(job["payload"].get("force_regenerate_image")) and job.get("previous_stages", {}).get("set_image_src") != "done"
+    service = ActivityService(workspace=JobWorkspace(job["payload"]["activity_id"]), force_regenerate_image=force_regenerate_image)
+    on_step("analyze_activity", "running")
+    service.analyze_activity()
+    on_step("analyze_activity", "done")
+    return service.build_activity(on_step=on_step)
+
+
+def run_activity_blueprint_batch_job(job, on_step):
+    service = ActivityBlueprintBatchService(batch_config=job["payload"]["batch_config"])
+    on_step("build_activity_blueprints", "running")
+    report = service.build_activity_blueprints()
+    on_step("build_activity_blueprints", "done")
+    return {key: report[key] for key in ["batch_id", "total", "succeeded", "failed", "report_path"]}
+
+
+JOB_HANDLERS = {
+    "activity_blueprint": run_activity_blueprint_job,
+    "activity": run_activity_job,
+    "activity_blueprint_batch": run_activity_blueprint_batch_job,
+}
+
+
+class JobWorker:
+    "Leases jobs from the queue one at a time, heartbeats while running them and records the outcome."
+    def __init__(self, queue=None, worker_id=None, poll_seconds=JOB_POLL_SECONDS):
+        self.queue = queue or JobQueue()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_seconds = poll_seconds
+        self.logger = setup_logger()
+
+    def heartbeat(self, job_id, stop):
+        while not stop.wait(self.queue.lease_seconds / 3):
+            if not self.queue.heartbeat(job_id, self.worker_id):
+                self.logger.error(f"{self.__class__.__name__}: Lost the lease on job {job_id}")
+                return
+
+    def run_job(self, job):
+        with bind_log_context(job_id=job["id"], job_type=job["type"], worker_id=self.worker_id):
+            self.logger.info(f"{self.__class__.__name__}: Worker {self.worker_id} running {job['type']} job {job['id']} (attempt {job['attempts']})")
+            stop = threading.Event()
+            heartbeat = threading.Thread(target=self.heartbeat, args=(job["id"], stop), daemon=True)
+            heartbeat.start()
+            try:
+                handler = JOB_HANDLERS[job["type"]]
+                result = handler(job, lambda stage, status: self.queue.update_stage(job["id"], stage, status))
+                self.queue.complete(job["id"], self.worker_id, result)
+                self.logger.info(f"{self.__class__.__name__}: Job {job['id']} succeeded")
+            except Exception as e:
+                self.queue.fail(job["id"], self.worker_id, e)
+                self.logger.error(f"{self.__class__.__name__}: Job {job['id']} failed - Error: {e}")
+            finally:
+                stop.set()
+                heartbeat.join()
+                flush_http_latency_stats()
+
+    def run_once(self) -> bool:
+        job = self.queue.lease(self.worker_id)
+        if job is None:
+            return False
+        self.run_job(job)
+        return True
+
+    def run_forever(self):
+        while True:
+            if not self.run_once():
+                time.sleep(self.poll_seconds)
+
+
+def run_worker():
+    JobWorker().run_forever()
+
+
+def run_worker_pool(workers):
+    "Runs `workers` worker processes and restarts any that exit."
+    processes = []
+    for _ in range(workers):
+        process = multiprocessing.Process(target=run_worker, daemon=True)
+        process.start()
+        processes.append(process)
+    while True:
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                processes[i] = multiprocessing.Process(target=run_worker, daemon=True)
+                processes[i].start()
+        time.sleep(JOB_POLL_SECONDS)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the activity job workers.")
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+    run_worker_pool(args.workers)
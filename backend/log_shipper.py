@@ -0,0 +1,172 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the background shipper that uploads finished job logs to S3.
+
+Ship whatever is left in the spool, e.g. after an outage, with:
+    - python -m backend.log_shipper
+"""
+
+
+import os
+import gzip
+import time
+import shutil
+import logging
+import threading
+from urllib.parse import quote, unquote
+from backend.clients import get_s3_client
+
+
+LOG_BUCKET = os.environ.get('LOG_BUCKET', 'lottie.logs')
+LOG_SPOOL_DIR = os.environ.get('LOG_SPOOL_DIR', 'data/logs/spool')
+LOG_SHIP_BATCH_BYTES = int(os.environ.get('LOG_SHIP_BATCH_BYTES', str(256 * 1024)))
+LOG_SHIP_INTERVAL = float(os.environ.get('LOG_SHIP_INTERVAL', '30'))
+LOG_SHIP_MAX_BACKOFF = float(os.environ.get('LOG_SHIP_MAX_BACKOFF', '600'))
+
+logger = logging.getLogger('job_logger')
+
+
+class LogShipper:
+    """
+    Ships job logs to S3 from a background thread.
+
+    submit() gzips the log into the spool directory and returns. The thread uploads
+    the spooled logs as one batch once they add up to `batch_bytes`, or `interval`
+    seconds after the oldest was spooled. A log is removed from the spool only
+    after its upload succeeded, so failed uploads, and logs spooled before a
+    restart, are retried with exponential back-off. The S3 client is injectable,
+    and S3_ENDPOINT_URL points the default one at a local stand-in.
+    """
+    def __init__(self, client=None, bucket=LOG_BUCKET, spool_dir=LOG_SPOOL_DIR,
+                 batch_bytes=LOG_SHIP_BATCH_BYTES, interval=LOG_SHIP_INTERVAL, max_backoff=LOG_SHIP_MAX_BACKOFF):
+        self.client = client
+        self.bucket = bucket
+        self.spool_dir = spool_dir
+        self.batch_bytes = batch_bytes
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.retry_at = 0.0
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        os.makedirs(spool_dir, exist_ok=True)
+
+    def get_client(self):
+        return self.client or get_s3_client()
+
+    def submit(self, log_file, key):
+        "Spools a gzipped copy of `log_file` for upload under `key`. Returns the spool path."
+        name = f"{time.time_ns()}_{quote(key, safe='')}.gz"
+        path = os.path.join(self.spool_dir, name)
+        temp_path = os.path.join(self.spool_dir, f".{name}.tmp")
+        with open(log_file, 'rb') as source, gzip.open(temp_path, 'wb') as target:
+            shutil.copyfileobj(source, target)
+        os.replace(temp_path, path)
+        if self.get_spool_bytes() >= self.batch_bytes:
+            self.wake.set()
+        return path
+
+    def list_spool(self):
+        "Returns the spooled log paths, oldest first."
+        names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.gz') and not name.startswith('.'))
+        return [os.path.join(self.spool_dir, name) for name in names]
+
+    def get_spool_bytes(self):
+        total = 0
+        for path in self.list_spool():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def is_due(self, paths):
+        if not paths or time.monotonic() < self.retry_at:
+            return False
+        oldest_spooled_at = int(os.path.basename(paths[0]).split('_', 1)[0]) / 1e9
+        return self.get_spool_bytes() >= self.batch_bytes or time.time() - oldest_spooled_at >= self.interval
+
+    def flush(self, force=False) -> int:
+        """
+        Uploads the spooled logs if a batch is due, or always with `force`. Returns
+        the number of uploaded logs; the batch stops at the first failed upload.
+        """
+        with self.flush_lock:
+            paths = self.list_spool()
+            if not paths or not (force or self.is_due(paths)):
+                return 0
+            client = self.get_client()
+            shipped = 0
+            for path in paths:
+                key = unquote(os.path.basename(path).split('_', 1)[1][:-len('.gz')])
+                try:
+                    with open(path, 'rb') as file:
+                        client.put_object(Bucket=self.bucket, Key=key, Body=file, ContentType='text/plain; charset=utf-8', ContentEncoding='gzip')
+                except FileNotFoundError:
+                    # Shipped by another worker process sharing the spool.
+                    continue
+                except Exception as e:
+                    self.failures += 1
+                    backoff = min(self.max_backoff, self.interval * 2 ** (self.failures - 1))
+                    self.retry_at = time.monotonic() + backoff
+                    logger.error(f"{self.__class__.__name__}: Uploading log {key} failed, retrying in {backoff:.0f}s - Error: {e}")
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                shipped += 1
+            if shipped and shipped == len(paths):
+                self.failures = 0
+                self.retry_at = 0.0
+            if shipped:
+                logger.info(f"{self.__class__.__name__}: Shipped {shipped} log(s) to S3 bucket {self.bucket}")
+            return shipped
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"{self.__class__.__name__}: Error shipping logs - Error: {e}")
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='log-shipper', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        "Stops the thread and makes a last attempt to ship the spool."
+        self.stopping.set()
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        self.flush(force=True)
+
+
+_log_shipper = None
+_log_shipper_pid = None
+_log_shipper_lock = threading.Lock()
+
+
+def get_log_shipper() -> LogShipper:
+    "Returns the running LogShipper of this process, starting it on first use."
+    global _log_shipper, _log_shipper_pid
+    if _log_shipper_pid != os.getpid():
+        with _log_shipper_lock:
+            if _log_shipper_pid != os.getpid():
+                _log_shipper = LogShipper().start()
+                _log_shipper_pid = os.getpid()
+    return _log_shipper
+
+
+if __name__ == '__main__':
+    shipped = LogShipper().flush(force=True)
+    print(f"Shipped {shipped} log(s) from {LOG_SPOOL_DIR} to {LOG_BUCKET}.")
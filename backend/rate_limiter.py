@@ -0,0 +1,273 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the token-bucket rate limiters for OpenAI requests, shared by every worker process.
+"""
+
+
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+OPENAI_CHAT_RPM = int(os.environ.get('OPENAI_CHAT_RPM', '500'))
+OPENAI_CHAT_TPM = int(os.environ.get('OPENAI_CHAT_TPM', '30000'))
+OPENAI_IMAGES_RPM = int(os.environ.get('OPENAI_IMAGES_RPM', '7'))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '5'))
+OPENAI_MAX_BACKOFF = float(os.environ.get('OPENAI_MAX_BACKOFF', '60'))
+# The buckets live next to the job queue, so the worker processes share one budget.
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH', 'data/jobs.sqlite3')
+
+RATE_LIMIT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    rate REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    paused_until REAL NOT NULL
+);
+"""
+
+
+
+def get_retryable_errors() -> tuple:
+    "Returns the OpenAI errors worth retrying. openai is imported on first use."
+    from openai import RateLimitError, APIConnectionError, InternalServerError
+    return (RateLimitError, APIConnectionError, InternalServerError)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at `rate_per_minute`.
+
+    Callers reserve tokens up front; the balance may go negative, and the
+    returned delay is how long the caller must wait for its reservation to be
+    covered. This keeps waiters in FIFO order without holding the lock while
+    sleeping, so the same bucket serves threads and asyncio tasks.
+    """
+    def __init__(self, rate_per_minute, capacity=None):
+        self.max_rate = rate_per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated_at = self.clock()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def clock(self):
+        return time.monotonic()
+
+    @contextmanager
+    def locked(self):
+        "Holds the bucket state for a read-modify-write."
+        with self.lock:
+            yield
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount=1) -> float:
+        "Reserves `amount` tokens and returns the seconds to wait before using them."
+        amount = min(amount, self.capacity)
+        with self.locked():
+            now = self.clock()
+            self.refill(now)
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def pause(self, seconds):
+        "Blocks new reservations for `seconds`, e.g. after the provider sent Retry-After."
+        with self.locked():
+            self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def slow_down(self, factor=0.5, floor=0.1):
+        "Multiplicatively lowers the refill rate after a rate-limit response."
+        with self.locked():
+            self.refill(self.clock())
+            self.rate = max(self.max_rate * floor, self.rate * factor)
+
+    def speed_up(self, step=0.05):
+        "Additively restores the refill rate after a successful request."
+        with self.locked():
+            self.refill(self.clock())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * step)
+
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose balance, refill rate and pause are kept in a SQLite table,
+    so every process reserving from the bucket `name`, such as the job workers and
+    the web app, draws on one budget. Each operation is one IMMEDIATE transaction;
+    wall-clock time is used, as monotonic clocks are not comparable across processes.
+    """
+    def __init__(self, name, rate_per_minute, capacity=None, path=RATE_LIMIT_DB_PATH):
+        self.name = name
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        super().__init__(rate_per_minute, capacity)
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(RATE_LIMIT_SCHEMA)
+        finally:
+            connection.close()
+
+    def clock(self):
+        return time.time()
+
+    @contextmanager
+    def locked(self):
+        with self.lock:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute("SELECT tokens, rate, updated_at, paused_until FROM rate_limit_buckets WHERE name = ?", (self.name,)).fetchone()
+                if row is None:
+                    self.tokens, self.rate, self.updated_at, self.paused_until = float(self.capacity), self.max_rate, self.clock(), 0.0
+                else:
+                    self.tokens, self.rate, self.updated_at, self.paused_until = row
+                    # The configured limits may have been lowered since the state was stored.
+                    self.tokens, self.rate = min(self.tokens, self.capacity), min(self.rate, self.max_rate)
+                yield
+                connection.execute(
+                    "INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, rate, updated_at, paused_until) VALUES (?, ?, ?, ?, ?)",
+                    (self.name, self.tokens, self.rate, self.updated_at, self.paused_until)
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            finally:
+                connection.close()
+
+
+def get_retry_after(error) -> float:
+    "Returns the delay requested by the provider's retry-after headers, if any."
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000.0
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class RateLimiter:
+    """
+    Request and token buckets for one OpenAI endpoint, with retries.
+
+    A 429 pauses the buckets for the Retry-After delay (or an exponential
+    backoff with jitter when none is given) and halves the refill rate; each
+    success restores part of it. Every caller shares the pause, so concurrent
+    builders back off together instead of thrashing. With a `name`, the buckets
+    are SharedTokenBucket rows, shared by every process using the same name.
+    """
+    def __init__(self, requests_per_minute, tokens_per_minute=None, max_retries=OPENAI_MAX_RETRIES, max_backoff=OPENAI_MAX_BACKOFF, name=None, path=RATE_LIMIT_DB_PATH):
+        if name:
+            self.requests = SharedTokenBucket(f"{name}.requests", requests_per_minute, path=path)
+            self.tokens = SharedTokenBucket(f"{name}.tokens", tokens_per_minute, path=path) if tokens_per_minute else None
+        else:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+
+    def buckets(self):
+        return [bucket for bucket in (self.requests, self.tokens) if bucket is not None]
+
+    def reserve(self, tokens=1) -> float:
+        wait = self.requests.reserve(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def backoff(self, error, attempt) -> float:
+        delay = get_retry_after(error)
+        if delay is None:
+            delay = min(self.max_backoff, 2 ** attempt) * (0.5 + random.random() / 2)
+        from openai import RateLimitError
+        if isinstance(error, RateLimitError):
+            for bucket in self.buckets():
+                bucket.pause(delay)
+                bucket.slow_down()
+        return delay
+
+    def succeeded(self):
+        for bucket in self.buckets():
+            bucket.speed_up()
+
+    def call(self, fn, tokens=1):
+        "Invokes `fn()` once the buckets allow it, retrying rate-limit and transient errors."
+        for attempt in range(self.max_retries + 1):
+            wait = self.reserve(tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                result = fn()
+            except get_retryable_errors() as error:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff(error, attempt))
+                continue
+            self.succeeded()
+            return result
+
+    async def call_async(self, fn, tokens=1):
+        "Awaits `fn()` once the buckets allow it, retrying rate-limit and transient errors."
+        for attempt in range(self.max_retries + 1):
+            wait = self.reserve(tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await fn()
+            except get_retryable_errors() as error:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff(error, attempt))
+                continue
+            self.succeeded()
+            return result
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name) -> RateLimiter:
+    "Returns the limiter for 'chat' completions or 'images' generation, whose budget all processes share."
+    limiter = _rate_limiters.get(name)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(name)
+            if limiter is None:
+                if name == 'chat':
+                    limiter = RateLimiter(OPENAI_CHAT_RPM, OPENAI_CHAT_TPM, name=name)
+                elif name == 'images':
+                    limiter = RateLimiter(OPENAI_IMAGES_RPM, name=name)
+                else:
+                    raise ValueError(f"Unknown rate limiter: {name}")
+                _rate_limiters[name] = limiter
+    return limiter
+
+
+def estimate_chat_tokens(messages, max_tokens) -> int:
+    "Rough token cost of a chat completion: ~4 characters per prompt token plus the completion budget."
+    characters = 0
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            characters += len(content)
+        else:
+            characters += sum(len(part.get("text", "")) for part in content)
+    return characters // 4 + max_tokens
@@ -0,0 +1,80 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the executor that runs builder steps declared as a dependency graph.
+"""
+
+
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def topological_order(steps: dict) -> list:
+    """
+    Returns the step names ordered so that every step follows its dependencies.
+
+    Ties are broken by declaration order, so a graph declared in the order of the
+    sequential builder chain yields exactly that chain.
+    """
+    order = []
+    done = set()
+    pending = list(steps)
+    while pending:
+        for name in pending:
+            if all(dependency in done for dependency in steps[name]):
+                break
+        else:
+            raise ValueError(f"Builder steps contain a dependency cycle or an unknown dependency: {pending}")
+        pending.remove(name)
+        done.add(name)
+        order.append(name)
+    return order
+
+
+def run_step(builder, name, on_step=None):
+    if on_step is not None:
+        on_step(name, "running")
+    try:
+        getattr(builder, name)()
+    except Exception:
+        if on_step is not None:
+            on_step(name, "failed")
+        raise
+    if on_step is not None:
+        on_step(name, "done")
+
+
+def run_step_graph(builder, steps: dict, max_workers=4, on_step=None):
+    """
+    Invokes `getattr(builder, name)()` for every step, starting each step as soon as
+    all of its dependencies have finished. Independent steps run concurrently on a
+    thread pool; the first failing step cancels the steps not yet started and its
+    exception is re-raised. `on_step(name, status)` is called as each step starts,
+    finishes or fails.
+    """
+    order = topological_order(steps)
+    if max_workers <= 1:
+        for name in order:
+            run_step(builder, name, on_step)
+        return builder
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(done) < len(order):
+            for name in order:
+                if name in done or name in running.values():
+                    continue
+                if all(dependency in done for dependency in steps[name]):
+                    # Each step runs in a copy of the caller's context so context-bound
+                    # state, such as the active job workspace, follows it into the pool.
+                    running[executor.submit(contextvars.copy_context().run, run_step, builder, name, on_step)] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    for pending in running:
+                        pending.cancel()
+                    raise error
+                done.add(name)
+    return builder
@@ -0,0 +1,99 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the incremental JSON parser used to read streamed activity completions.
+"""
+
+
+import json
+
+
+class ActivityStreamParser:
+    """
+    Incrementally scans a streamed JSON activity object and reports its fields
+    as soon as they can be shown.
+
+    String fields ('sentence', 'media.style') are reported while they grow;
+    object fields ('questions') are reported once they are complete. The scanner
+    visits every input character once, so a chunk costs O(len(chunk)) plus the
+    decoding of the field currently being streamed.
+    """
+    STRING_FIELDS = {("sentence",): "sentence", ("media", "style"): "media.style"}
+    OBJECT_FIELDS = {("questions",): "questions"}
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.string_is_key = False
+        self.fields = {}
+
+    def path(self):
+        return tuple(frame["key"] for frame in self.stack if frame["type"] == "object")
+
+    def decode(self, raw):
+        "Decodes a possibly truncated JSON string body."
+        for end in range(len(raw), max(len(raw) - 6, -1), -1):
+            try:
+                return json.loads(f'"{raw[:end]}"', strict=False)
+            except ValueError:
+                continue
+        return ""
+
+    def feed(self, chunk: str) -> dict:
+        "Consumes the next chunk and returns the fields that changed because of it."
+        self.buffer += chunk
+        updates = {}
+        buffer = self.buffer
+        while self.position < len(buffer):
+            i = self.position
+            char = buffer[i]
+            self.position += 1
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    raw = buffer[self.string_start:i]
+                    if self.string_is_key:
+                        self.stack[-1]["key"] = self.decode(raw)
+                    else:
+                        name = self.STRING_FIELDS.get(self.path())
+                        value = self.decode(raw) if name else None
+                        if name and value != self.fields.get(name):
+                            updates[name] = self.fields[name] = value
+                continue
+            if char == '"':
+                self.in_string = True
+                self.string_start = i + 1
+                self.string_is_key = bool(self.stack) and self.stack[-1]["type"] == "object" and self.stack[-1]["expect"] == "key"
+            elif char in "{[":
+                self.stack.append({"type": "object" if char == "{" else "array", "key": None, "expect": "key", "start": i})
+            elif char in "}]":
+                frame = self.stack.pop()
+                name = self.OBJECT_FIELDS.get(self.path())
+                if name and frame["type"] == "object":
+                    try:
+                        updates[name] = self.fields[name] = json.loads(buffer[frame["start"]:i + 1])
+                    except ValueError:
+                        pass
+            elif char == ":" and self.stack:
+                self.stack[-1]["expect"] = "value"
+            elif char == "," and self.stack:
+                self.stack[-1]["expect"] = "key"
+        if self.in_string and not self.string_is_key:
+            name = self.STRING_FIELDS.get(self.path())
+            if name:
+                value = self.decode(self.buffer[self.string_start:])
+                if value != self.fields.get(name):
+                    updates[name] = self.fields[name] = value
+        return updates
+
+    def result(self) -> dict:
+        "Parses the complete buffered completion."
+        return json.loads(self.buffer)
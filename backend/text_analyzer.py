@@ -11,10 +11,145 @@ Validate package installation by running the following commands:
     - python -m cefrpy validate
 """
 
-from cefrpy import CEFRAnalyzer
+import os
+import re
+import math
+import threading
+from functools import lru_cache
 from backend.helpers import setup_logger
+from backend.job_logging import LogPayload
+
+CEFR_LEVELS = ["A1", "A2", "B1", "B2", "C1", "C2"]
+# Target levels as thresholds on the cefrpy scale. The scale starts at A1, so pre-A1
+# groups get the A1 ceiling: only words above A1 count as offending for them.
+CEFR_TARGETS = {"PRE-A1": 1, **{level: index + 1 for index, level in enumerate(CEFR_LEVELS)}}
+CEFR_WORD_CACHE_SIZE = int(os.environ.get('CEFR_WORD_CACHE_SIZE', '50000'))
+
+WORD_PATTERN = re.compile(r"[a-z]+(?:'[a-z]+)*")
+CONTRACTIONS = {"can't": "can", "won't": "will", "shan't": "shall", "ain't": "be"}
+CONTRACTION_SUFFIXES = ["n't", "'s", "'re", "'ve", "'ll", "'d", "'m"]
+IRREGULAR_LEMMAS = {
+    "am": "be", "is": "be", "are": "be", "was": "be", "were": "be", "been": "be", "being": "be",
+    "has": "have", "had": "have", "does": "do", "did": "do", "done": "do",
+    "went": "go", "gone": "go", "made": "make", "saw": "see", "seen": "see",
+    "took": "take", "taken": "take", "came": "come", "got": "get", "gotten": "get",
+    "children": "child", "people": "person", "men": "man", "women": "woman",
+    "better": "good", "best": "good", "worse": "bad", "worst": "bad",
+}
+
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
+
+def get_cefr_analyzer():
+    "Returns the shared CEFRAnalyzer, importing cefrpy and loading its word database on first use."
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                from cefrpy import CEFRAnalyzer
+                _analyzer = CEFRAnalyzer()
+    return _analyzer
+
+
+def tokenize(text) -> list:
+    "Splits text into lowercase word tokens, dropping punctuation, digits and contraction suffixes."
+    tokens = []
+    for token in WORD_PATTERN.findall(text.lower().replace("’", "'")):
+        if token in CONTRACTIONS:
+            token = CONTRACTIONS[token]
+        else:
+            for suffix in CONTRACTION_SUFFIXES:
+                if token.endswith(suffix):
+                    token = token[:-len(suffix)]
+                    break
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def get_lemma_candidates(word) -> list:
+    "Returns the word followed by the base forms it may be inflected from, most likely first."
+    candidates = [word]
+    if word in IRREGULAR_LEMMAS:
+        candidates.append(IRREGULAR_LEMMAS[word])
+    for suffix, replacements in [("ies", ["y"]), ("ied", ["y"]), ("es", ["", "e"]), ("s", [""]),
+                                 ("ing", ["", "e"]), ("ed", ["", "e"]), ("est", ["", "e"]), ("er", ["", "e"]), ("ly", [""])]:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            stem = word[:-len(suffix)]
+            candidates.extend(stem + replacement for replacement in replacements)
+            # Doubled final consonant: stopped -> stop, bigger -> big.
+            if len(stem) >= 3 and stem[-1] == stem[-2] and stem[-1] not in "aeiou":
+                candidates.append(stem[:-1])
+    return list(dict.fromkeys(candidates))
+
+
+@lru_cache(maxsize=CEFR_WORD_CACHE_SIZE)
+def get_word_level(word):
+    """
+    Returns (lemma, level) for the first lemma candidate found in the cefrpy
+    database, where level is the average CEFR level as a float from 1.0 (A1) to
+    6.0 (C2), or (None, None) for unknown words. Memoized in a bounded LRU.
+    """
+    analyzer = get_cefr_analyzer()
+    for candidate in get_lemma_candidates(word):
+        level = analyzer.get_average_word_level_float(candidate)
+        if level is not None:
+            return candidate, level
+    return None, None
+
+
+def round_cefr_level(level) -> int:
+    "Rounds a float level to the nearest whole level, halves up (2.5 -> 3, 3.5 -> 4)."
+    return math.floor(level + 0.5)
+
+
+def get_cefr_label(level) -> str:
+    return CEFR_LEVELS[min(max(round_cefr_level(level), 1), len(CEFR_LEVELS)) - 1]
+
+
+def analyze_texts(texts, cefr_level=None) -> list:
+    """
+    Returns one CEFR report per text. Words are deduplicated across the whole
+    batch before they are looked up, so each distinct word is resolved once.
+
+    A report holds the level distribution of the known word tokens, the share of
+    those tokens above `cefr_level` (e.g. "b1" or "pre-a1") and the offending words, hardest
+    first, plus the words missing from the cefrpy database.
+    """
+    tokenized = [tokenize(text or "") for text in texts]
+    levels = {word: get_word_level(word) for word in set().union(*tokenized)}
+    target = CEFR_TARGETS.get(cefr_level.strip().upper()) if cefr_level else None
+    reports = []
+    for tokens in tokenized:
+        distribution = dict.fromkeys(CEFR_LEVELS, 0)
+        known = 0
+        above_target = 0
+        offending = {}
+        unknown = []
+        for token in tokens:
+            lemma, level = levels[token]
+            if level is None:
+                if token not in unknown:
+                    unknown.append(token)
+                continue
+            label = get_cefr_label(level)
+            distribution[label] += 1
+            known += 1
+            if target is not None and round_cefr_level(level) > target:
+                above_target += 1
+                offending[token] = {"word": token, "lemma": lemma, "level": label, "level_float": round(level, 2)}
+        reports.append({
+            "cefr_level": cefr_level,
+            "word_count": len(tokens),
+            "known_word_count": known,
+            "distribution": distribution,
+            "share_above_target": round(above_target / known, 4) if target is not None and known else None,
+            "offending_words": sorted(offending.values(), key=lambda word: -word["level_float"]),
+            "unknown_words": unknown,
+        })
+    return reports
 
-analyzer = CEFRAnalyzer()
 
 class TextAnalyzer:
     def __init__(self, sentence):
@@ -22,14 +157,14 @@ class TextAnalyzer:
         self.logger = setup_logger()
 
     def get_average_word_level_float(self, word):
-        return analyzer.get_average_word_level_float(word)
+        return get_cefr_analyzer().get_average_word_level_float(word)
 
     def get_average_word_level_CEFR(self, word):
-        return analyzer.get_average_word_level_CEFR(word)
-    
-    def assess_sentence_language_level_cefrpy(self):
-        self.logger.info(f"{self.__class__.__name__}: Invoking 'assess_language_level' using cefrpy for sentence: '{self.sentence}'")
-        words = self.sentence[:-1].split(" ") if self.sentence[-1] == "." else self.sentence.split(" ")
-        for word in words:
-            self.logger.info(f"{word} : {self.get_average_word_level_CEFR(word)}")
+        return get_cefr_analyzer().get_average_word_level_CEFR(word)
 
+    def assess_sentence_language_level_cefrpy(self, cefr_level=None):
+        "Returns the CEFR report of the sentence against the target `cefr_level`, see analyze_texts."
+        self.logger.info("%s: Invoking 'assess_language_level' using cefrpy for sentence: %s", self.__class__.__name__, LogPayload(self.sentence))
+        report = analyze_texts([self.sentence], cefr_level)[0]
+        self.logger.info("%s: CEFR distribution: %s, share above %s: %s, offending words: %s", self.__class__.__name__, LogPayload(report['distribution']), cefr_level, report['share_above_target'], LogPayload(report["offending_words"]))
+        return report
@@ -0,0 +1,141 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the job-scoped workspaces that let several activities be built concurrently.
+"""
+
+
+import os
+import json
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from backend.job_logging import JsonFormatter, bind_log_context, flush_logs
+
+
+WORKSPACES_DIR = 'data/jobs'
+LEGACY_ACTIVITY_BLUEPRINT_PATH = 'data/activity_blueprint.json'
+LEGACY_ACTIVITY_PATH = 'data/activity.json'
+
+_current_workspace = contextvars.ContextVar('current_workspace', default=None)
+
+
+def parse_activity_id(activity_id) -> str:
+    "Returns the canonical form of a UUID activity id. Raises ValueError for anything else."
+    try:
+        return str(uuid.UUID(str(activity_id)))
+    except ValueError:
+        raise ValueError(f"Invalid activity id: {activity_id!r}") from None
+
+
+class JobWorkspace:
+    """
+    Directory data/jobs/<activity id>/ holding everything one activity job reads
+    and writes: the config snapshot, the blueprint, the built activity and the
+    job log. Jobs never share these files, so they can run side by side.
+    """
+    def __init__(self, activity_id=None, root=WORKSPACES_DIR):
+        # Only canonical UUIDs name a workspace, so an id can never point outside `root`.
+        self.activity_id = parse_activity_id(activity_id) if activity_id else str(uuid.uuid4())
+        self.path = os.path.join(root, self.activity_id)
+        self.config_path = os.path.join(self.path, 'config.json')
+        self.activity_blueprint_path = os.path.join(self.path, 'activity_blueprint.json')
+        self.activity_path = os.path.join(self.path, 'activity.json')
+        self.log_path = os.path.join(self.path, 'job.log')
+        os.makedirs(self.path, exist_ok=True)
+        self.log_handler = None
+
+    @classmethod
+    def create(cls, activity_blueprint_config, root=WORKSPACES_DIR):
+        "Creates a workspace for a new activity with a snapshot of the blueprint config."
+        workspace = cls(root=root)
+        write_json_atomic(workspace.config_path, activity_blueprint_config)
+        return workspace
+
+    @classmethod
+    def open(cls, activity_id, root=WORKSPACES_DIR):
+        """
+        Returns the workspace of an existing blueprint. Raises ValueError when the
+        id is not a UUID and FileNotFoundError when it has no blueprint.
+        """
+        activity_id = parse_activity_id(activity_id)
+        if not os.path.exists(os.path.join(root, activity_id, 'activity_blueprint.json')):
+            raise FileNotFoundError(f"Activity {activity_id} has no blueprint")
+        return cls(activity_id, root=root)
+
+    @classmethod
+    def from_legacy_blueprint(cls, root=WORKSPACES_DIR):
+        """
+        Returns the workspace of the blueprint in data/activity_blueprint.json, copying
+        the reviewed blueprint into it.
+        """
+        with open(LEGACY_ACTIVITY_BLUEPRINT_PATH, 'r') as file:
+            data = json.load(file)
+        workspace = cls(data["id"], root=root)
+        write_json_atomic(workspace.activity_blueprint_path, data)
+        return workspace
+
+    def load_config(self):
+        with open(self.config_path, 'r') as file:
+            return json.load(file)
+
+    @contextmanager
+    def activate(self):
+        """
+        Binds the workspace to the current context: records logged through the job
+        logger in this context, including from builder step threads, are also
+        written to the workspace log and carry the activity id.
+        """
+        handler = logging.FileHandler(self.log_path)
+        handler.setLevel(logging.INFO)
+        handler.setFormatter(JsonFormatter())
+        self.log_handler = handler
+        token = _current_workspace.set(self)
+        try:
+            with bind_log_context(activity_id=self.activity_id):
+                yield self
+        finally:
+            _current_workspace.reset(token)
+            # Records are written by the log listener thread; let it catch up before
+            # the workspace log is closed.
+            flush_logs()
+            self.log_handler = None
+            handler.close()
+
+
+def get_current_workspace():
+    return _current_workspace.get()
+
+
+class WorkspaceLogFilter(logging.Filter):
+    "Tags the record with the workspace active in the emitting context."
+    def filter(self, record):
+        record.workspace = _current_workspace.get()
+        return True
+
+
+class WorkspaceLogHandler(logging.Handler):
+    "Forwards records to the log of the workspace they were tagged with by WorkspaceLogFilter."
+    def emit(self, record):
+        workspace = getattr(record, 'workspace', None)
+        if workspace is not None and workspace.log_handler is not None:
+            workspace.log_handler.handle(record)
+
+
+def write_json_atomic(file_path, data, indent=4):
+    """
+    Writes JSON to a temporary file next to `file_path` and renames it into place.
+    With `indent=None` the JSON is written without any whitespace.
+    """
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    temp_path = os.path.join(directory, f".{os.path.basename(file_path)}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_path, 'w') as file:
+            json.dump(data, file, indent=indent, separators=(',', ':') if indent is None else None)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
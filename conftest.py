@@ -0,0 +1,6 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module marks the repository root for pytest, so the tests import 'backend' and 'app'
+whether they are run with 'pytest' or 'python -m pytest'.
+"""
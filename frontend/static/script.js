@@ -1,4 +1,8 @@
 document.addEventListener('DOMContentLoaded', () => {
+  if (new URLSearchParams(window.location.search).has('stream')) {
+    streamActivityBlueprint();
+    return;
+  }
   fetch('data/activity.json')
     .then(response => response.json())
     .then(jsonData => {
@@ -6,7 +10,7 @@ document.addEventListener('DOMContentLoaded', () => {
       let activity_object = jsonData;
 
       // Render image
-      document.querySelector('.image').innerHTML = `<img id="target_image" src="${activity_object.media.image_src}" alt="Image">`;
+      document.querySelector('.image').innerHTML = renderImage(activity_object.media);
       document.getElementById('image_container').addEventListener('click', () => {
         window.open(activity_object.media.image_src, '_blank');
       });
@@ -15,30 +19,7 @@ document.addEventListener('DOMContentLoaded', () => {
       document.getElementById('sentence').textContent = `${activity_object.sentence}`;
 
       // Render questions
-      const questionsContainer = document.getElementById('questions_container');
-      const questions = activity_object.questions;
-
-      for (let key in questions) {
-        if (questions.hasOwnProperty(key)) {
-          const questionDiv = document.createElement('div');
-          questionDiv.className = 'question_div';
-          questionDiv.onclick = () => toggleAnswer(`answer_${key}`);
-
-          const questionText = document.createElement('span');
-          questionText.className = 'question';
-          questionText.id = `question_${key}`;
-          questionText.textContent = questions[key].sentence;
-
-          const answerText = document.createElement('div');
-          answerText.className = 'answer';
-          answerText.id = `answer_${key}`;
-          answerText.textContent = questions[key].answer;
-
-          questionDiv.appendChild(questionText);
-          questionDiv.appendChild(answerText);
-          questionsContainer.appendChild(questionDiv);
-        }
-      }
+      renderQuestions(activity_object.questions);
 
       // Render options
       document.getElementById('option_a').textContent = `${activity_object.options.A}`;
@@ -75,6 +56,79 @@ document.addEventListener('DOMContentLoaded', () => {
     });
 });
 
+// Serves the smallest compressed variant that fills the image container, in
+// WebP where supported, falling back to the full-size original.
+function renderImage(media) {
+  const img = `<img id="target_image" src="${media.image_src}" sizes="94vw" alt="Image">`;
+  if (!media.image_srcset) {
+    return img;
+  }
+  const sources = Object.entries(media.image_srcset)
+    .map(([type, srcset]) => `<source type="${type}" srcset="${srcset}" sizes="94vw">`)
+    .join('');
+  return `<picture>${sources}${img}</picture>`;
+}
+
+function renderQuestions(questions) {
+  const questionsContainer = document.getElementById('questions_container');
+  questionsContainer.innerHTML = '';
+
+  for (let key in questions) {
+    if (questions.hasOwnProperty(key)) {
+      const questionDiv = document.createElement('div');
+      questionDiv.className = 'question_div';
+      questionDiv.onclick = () => toggleAnswer(`answer_${key}`);
+
+      const questionText = document.createElement('span');
+      questionText.className = 'question';
+      questionText.id = `question_${key}`;
+      questionText.textContent = questions[key].sentence;
+
+      const answerText = document.createElement('div');
+      answerText.className = 'answer';
+      answerText.id = `answer_${key}`;
+      answerText.textContent = questions[key].answer;
+
+      questionDiv.appendChild(questionText);
+      questionDiv.appendChild(answerText);
+      questionsContainer.appendChild(questionDiv);
+    }
+  }
+}
+
+// Builds a new activity blueprint and renders it while it is being generated.
+function streamActivityBlueprint() {
+  const source = new EventSource('/baba/stream');
+  document.querySelector('.image').textContent = 'Generating...';
+
+  source.addEventListener('partial', (event) => {
+    const fields = JSON.parse(event.data);
+    if (fields.sentence !== undefined) {
+      document.getElementById('sentence').textContent = fields.sentence;
+    }
+    if (fields['media.style'] !== undefined) {
+      document.querySelector('.image').textContent = fields['media.style'];
+    }
+    if (fields.questions !== undefined) {
+      renderQuestions(fields.questions);
+    }
+  });
+
+  source.addEventListener('complete', (event) => {
+    const activity_object = JSON.parse(event.data);
+    document.getElementById('sentence').textContent = activity_object.sentence;
+    document.querySelector('.image').textContent = activity_object.media.style;
+    renderQuestions(activity_object.questions);
+  });
+
+  source.addEventListener('error', (event) => {
+    if (event.data) {
+      console.error('Error building activity blueprint:', JSON.parse(event.data).message);
+    }
+    source.close();
+  });
+}
+
 function toggleAnswer(answerId) {
   const answerElement = document.getElementById(answerId);
   if (answerElement.style.display === 'none' || answerElement.style.display === '') {
@@ -0,0 +1,78 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the activity schema, its validator and the repair of invalid completions.
+"""
+
+
+import json
+import pytest
+from backend.activity_schema import make_response_format, repair_activity_completion, validate_activity_completion
+from backend.connectors import FmLottieConnector, MAX_REPAIR_ATTEMPTS
+
+QUESTIONS = {key: {"sentence": f"Question {key}?", "answer": "true"} for key in ["1", "2", "3"]}
+ACTIVITY = {"media": {"style": "watercolour"}, "sentence": "The sea is blue.", "questions": QUESTIONS}
+
+
+class FakeConnector(FmLottieConnector):
+    "Answers the repair requests with the queued completions."
+    def __init__(self, completions):
+        super().__init__()
+        self.completions = list(completions)
+        self.requests = []
+
+    def complete(self, request):
+        self.requests.append(request)
+        return self.completions.pop(0)
+
+
+def test_response_format_is_strict():
+    schema = make_response_format()["json_schema"]
+    assert schema["strict"] is True
+    assert schema["schema"]["required"] == ["media", "sentence", "questions"]
+    assert schema["schema"]["additionalProperties"] is False
+    assert make_response_format(["sentence"])["json_schema"]["schema"]["properties"] == {"sentence": {"type": "string"}}
+
+
+def test_validator_reports_each_failing_field():
+    assert validate_activity_completion(ACTIVITY) == {}
+    errors = validate_activity_completion({"media": {"style": " "}, "sentence": "Fine.", "questions": {"1": QUESTIONS["1"]}})
+    assert sorted(errors) == ["media", "questions"]
+    errors = validate_activity_completion(dict(ACTIVITY, questions=dict(QUESTIONS, **{"2": {"sentence": "Q?", "answer": ""}})))
+    assert errors == {"questions": "'questions.2' must be an object with non-empty 'sentence' and 'answer' strings"}
+    assert sorted(validate_activity_completion(None)) == ["media", "questions", "sentence"]
+
+
+def test_string_encoded_questions_are_repaired_locally():
+    activity = dict(ACTIVITY, questions={key: json.dumps(question) for key, question in QUESTIONS.items()})
+    assert validate_activity_completion(repair_activity_completion(activity)) == {}
+
+
+def test_valid_completion_needs_no_request():
+    connector = FakeConnector([])
+    assert connector.validate_completion(connector.make_completion_request("prompt"), json.dumps(ACTIVITY)) == ACTIVITY
+    assert connector.requests == []
+
+
+def test_strict_schema_failure_regenerates_only_the_bad_field():
+    connector = FakeConnector([json.dumps({"questions": QUESTIONS, "sentence": "Ignored, it was valid."})])
+    content = json.dumps(dict(ACTIVITY, questions={"1": QUESTIONS["1"]}))
+    activity = connector.validate_completion(connector.make_completion_request("prompt"), content)
+    assert activity == ACTIVITY
+    repair_request = connector.requests[0]
+    assert repair_request["response_format"]["json_schema"]["schema"]["required"] == ["questions"]
+    assert "questions" in repair_request["messages"][-1]["content"]
+    assert json.loads(repair_request["messages"][-2]["content"])["sentence"] == ACTIVITY["sentence"]
+
+
+def test_unparseable_completion_is_regenerated_whole():
+    connector = FakeConnector([json.dumps(ACTIVITY)])
+    assert connector.validate_completion(connector.make_completion_request("prompt"), '{"sentence": "cut off') == ACTIVITY
+    assert connector.requests[0]["response_format"]["json_schema"]["schema"]["required"] == ["media", "sentence", "questions"]
+
+
+def test_repair_gives_up_after_the_maximum_attempts():
+    connector = FakeConnector([json.dumps({"sentence": ""})] * MAX_REPAIR_ATTEMPTS)
+    with pytest.raises(ValueError):
+        connector.validate_completion(connector.make_completion_request("prompt"), json.dumps(dict(ACTIVITY, sentence="")))
+    assert len(connector.requests) == MAX_REPAIR_ATTEMPTS
@@ -0,0 +1,87 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the completion cache and of the deterministic activity prompts.
+"""
+
+
+import json
+import pytest
+import backend.connectors as connectors
+from backend.activity import Activity
+from backend.activity_blueprint_builder import FMGAILottieReadingActivityBlueprintBuilder
+from backend.completion_cache import CompletionCache, CompletionCacheMiss
+from backend.helpers import make_activity_prompt, make_prompt_rng
+
+COMPLETION = {
+    "sentence": "Anna reads a book about the sea.",
+    "media": {"style": "watercolour"},
+    "questions": {key: {"sentence": f"Question {key}?", "answer": "true"} for key in ["1", "2", "3"]}
+}
+
+ACTIVITY_BLUEPRINT_CONFIG = {
+    "metadata": {"analyst": "M-Maker25"},
+    "prompt": {"include_ss": True, "premise": {"include_custom_premise": False}},
+    "ms_interest_token": {"active": True, "target_student": "random"},
+}
+
+SLOT = {
+    "assigned_group": {"alias": "group1"},
+    "students": [
+        {"alias": "s1", "first_name": "Anna", "last_name": "Novak"},
+        {"alias": "s2", "first_name": "Luka", "last_name": "Horvat"},
+    ],
+}
+
+VOCABULARY = ["sea", "book", "wave", "sand", "shell", "boat", "fish"]
+ITOKENS = {"s1": [{"hobbies": ["sailing", "chess"]}], "s2": [{"music": {"bands": ["a", "b"]}}]}
+
+
+def build_sentence():
+    "Runs the sentence step of a new blueprint for the same slot, as a re-run of '/baba' would."
+    builder = FMGAILottieReadingActivityBlueprintBuilder(Activity(), activity_blueprint_config=ACTIVITY_BLUEPRINT_CONFIG)
+    builder.activity.metadata = {"sandbox_slot": SLOT, "target_material": [{"title": "The Sea"}]}
+    builder.activity.target_vocabulary = list(VOCABULARY)
+    builder.activity.itokens = ITOKENS
+    builder.set_media()
+    builder.set_sentence()
+    return builder.activity
+
+
+@pytest.fixture
+def completions(tmp_path, monkeypatch):
+    "Serves completions from a fresh cache and records the requests that reach the provider."
+    requests = []
+    cache = CompletionCache(directory=str(tmp_path))
+    monkeypatch.setattr(connectors, 'get_completion_cache', lambda: cache)
+
+    def complete(self, request):
+        requests.append(request)
+        return json.dumps(COMPLETION)
+
+    monkeypatch.setattr(connectors.FmLottieConnector, 'complete', complete)
+    return cache, requests
+
+
+def test_same_inputs_assemble_the_same_prompt():
+    prompts = {make_activity_prompt({}, VOCABULARY, None, False, [], rng=make_prompt_rng(SLOT, VOCABULARY)) for _ in range(5)}
+    assert len(prompts) == 1
+
+
+def test_second_run_of_a_blueprint_is_served_from_cache(completions):
+    cache, requests = completions
+    first = build_sentence()
+    second = build_sentence()
+    assert len(requests) == 1
+    assert second.sentence == first.sentence
+    assert second.metadata["ms_interest_token_logs"] == first.metadata["ms_interest_token_logs"]
+    # Fully offline: a replayed run never reaches the provider.
+    cache.mode = 'replay'
+    assert build_sentence().sentence == first.sentence
+    assert len(requests) == 1
+
+
+def test_replay_mode_raises_on_a_miss(tmp_path):
+    cache = CompletionCache(directory=str(tmp_path), mode='replay')
+    with pytest.raises(CompletionCacheMiss):
+        cache.get(cache.make_key({"model": "gpt-4o", "messages": []}))
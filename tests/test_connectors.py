@@ -0,0 +1,45 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the activity generation connectors.
+"""
+
+
+import json
+import asyncio
+import pytest
+from backend.connectors import FmLottieConnector, AsyncFmLottieConnector
+
+VALID_QUESTIONS = {key: {"sentence": f"Question {key}?", "answer": "true"} for key in ["1", "2", "3"]}
+
+
+class FakeAsyncConnector(AsyncFmLottieConnector):
+    "Answers every repair request with the fields it asks for."
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def complete(self, request):
+        self.requests.append(request)
+        return json.dumps({"sentence": "A repaired sentence."})
+
+
+def test_async_connector_repairs_only_the_failing_field():
+    connector = FakeAsyncConnector()
+    content = json.dumps({"sentence": "", "media": {"style": "watercolour"}, "questions": VALID_QUESTIONS})
+    activity = asyncio.run(connector.validate_completion(connector.make_completion_request("prompt"), content))
+    assert activity["sentence"] == "A repaired sentence."
+    assert activity["media"] == {"style": "watercolour"}
+    assert len(connector.requests) == 1
+    assert connector.requests[0]["response_format"]["json_schema"]["schema"]["required"] == ["sentence"]
+
+
+def test_async_connector_does_not_stream():
+    with pytest.raises(NotImplementedError):
+        AsyncFmLottieConnector().stream_activity_sentence("prompt")
+
+
+def test_sync_and_async_connectors_share_the_repair_loop():
+    content = json.dumps({"sentence": "A sentence.", "media": {"style": "ink"}, "questions": VALID_QUESTIONS})
+    request = FmLottieConnector().make_completion_request("prompt")
+    assert FmLottieConnector().validate_completion(request, content) == asyncio.run(FakeAsyncConnector().validate_completion(request, content))
@@ -0,0 +1,71 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the paginated, filterable history query and the '/history' endpoint.
+"""
+
+
+import os
+import json
+import pytest
+from backend.history_store import HistoryStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = HistoryStore(path=os.path.join(tmp_path, 'history.sqlite3'))
+    for i in range(12):
+        store.append({
+            "id": f"a{i}",
+            "group_alias": "group1" if i % 2 == 0 else "group2",
+            "cefr_level": "A2" if i % 3 == 0 else "B1",
+            "target_vocabulary": ["sea"] if i % 4 == 0 else ["sky"],
+            "metadata": {"analyst": "M-Maker25", "sandbox_slot": {"due_date": f"2024-10-{i + 1:02d}"}},
+        })
+    return store
+
+
+def read_ids(store, filters, limit):
+    "Reads every page with the store's cursor and returns the ids page by page."
+    pages = []
+    cursor = None
+    while True:
+        rows = list(store.query(filters, cursor=cursor, limit=limit))
+        if not rows:
+            return pages
+        pages.append([json.loads(data)["id"] for _, data in rows])
+        cursor = rows[-1][0]
+
+
+def test_cursor_pages_cover_every_match_once(store):
+    pages = read_ids(store, {"group_alias": "group1"}, limit=4)
+    assert pages == [["a10", "a8", "a6", "a4"], ["a2", "a0"]]
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({"cefr_level": "A2"}, ["a9", "a6", "a3", "a0"]),
+    ({"group_alias": "group1", "cefr_level": "A2"}, ["a6", "a0"]),
+    ({"word": "Sea"}, ["a8", "a4", "a0"]),
+    ({"date_from": "2024-10-03", "date_to": "2024-10-05"}, ["a4", "a3", "a2"]),
+    ({"analyst": "nobody"}, []),
+])
+def test_filters_combine_across_pages(store, filters, expected):
+    assert sum(read_ids(store, filters, limit=2), []) == expected
+
+
+def test_history_endpoint_pages_with_next_cursor(store, monkeypatch):
+    pytest.importorskip("flask", reason="the endpoint test requires Flask")
+    import app
+    monkeypatch.setattr(app, 'get_history_store', lambda: store)
+    client = app.app.test_client()
+    ids = []
+    cursor = ''
+    for _ in range(5):
+        page = json.loads(client.get(f'/history?group_alias=group2&limit=2&cursor={cursor}').get_data(as_text=True))
+        ids += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == ["a11", "a9", "a7", "a5", "a3", "a1"]
+    assert client.get('/history?limit=abc').status_code == 400
+    assert json.loads(client.get('/history?word=none').get_data(as_text=True)) == {"items": [], "next_cursor": None}
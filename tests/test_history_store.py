@@ -0,0 +1,95 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the append-only history store and its legacy migration.
+"""
+
+
+import os
+import json
+import threading
+import pytest
+from backend.history_store import HistoryStore, get_history_index_fields
+
+
+def make_activity(activity_id, group_alias="group1", cefr_level="A2", analyst="M-Maker25", due_date="2024-10-01", vocabulary=("sea",)):
+    return {
+        "id": activity_id,
+        "group_alias": group_alias,
+        "cefr_level": cefr_level,
+        "target_vocabulary": list(vocabulary),
+        "metadata": {"analyst": analyst, "sandbox_slot": {"due_date": due_date}},
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    return HistoryStore(path=os.path.join(tmp_path, 'history.sqlite3'))
+
+
+def write_legacy_history(tmp_path, dataset):
+    path = os.path.join(tmp_path, 'history.json')
+    with open(path, 'w') as file:
+        json.dump(dataset, file)
+    return path
+
+
+def test_index_fields_fall_back_to_the_slot_start_time():
+    assert get_history_index_fields(make_activity("a"))["date"] == "2024-10-01"
+    activity = {"id": "b", "metadata": {"analyst": "x", "sandbox_slot": {"start_time": "2024-10-02T08:00:00"}}}
+    assert get_history_index_fields(activity) == {"activity_id": "b", "group_alias": None, "cefr_level": None, "analyst": "x", "date": "2024-10-02"}
+    assert get_history_index_fields({})["date"] is None
+
+
+def test_append_and_get_latest(store):
+    store.append(make_activity("a", cefr_level="A1"))
+    store.append(make_activity("b"))
+    store.append(make_activity("a", cefr_level="B1"))
+    assert store.get("a")["cefr_level"] == "B1"
+    assert store.get("missing") is None
+    assert [json.loads(data)["id"] for _, data in store.query()] == ["a", "b", "a"]
+
+
+def test_concurrent_appends_are_all_kept(store):
+    threads = [threading.Thread(target=store.append, args=(make_activity(f"a{i}"),)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(list(store.query(limit=100))) == 20
+
+
+def test_legacy_history_is_migrated_once_in_order(store, tmp_path):
+    legacy_path = write_legacy_history(tmp_path, [make_activity("old1"), {"id": "old2"}, make_activity("old3")])
+    assert store.migrate_legacy_history(legacy_path) == 3
+    store.append(make_activity("new"))
+    assert store.migrate_legacy_history(legacy_path) == 0
+    assert [json.loads(data)["id"] for _, data in store.query()] == ["new", "old3", "old2", "old1"]
+
+
+def test_missing_legacy_history_is_not_marked_migrated(store, tmp_path):
+    legacy_path = os.path.join(tmp_path, 'history.json')
+    assert store.migrate_legacy_history(legacy_path) == 0
+    write_legacy_history(tmp_path, [make_activity("old")])
+    assert store.migrate_legacy_history(legacy_path) == 1
+
+
+def test_failed_migration_imports_nothing(store, tmp_path):
+    legacy_path = write_legacy_history(tmp_path, [make_activity("old1"), "not a record"])
+    with pytest.raises(AttributeError):
+        store.migrate_legacy_history(legacy_path)
+    assert list(store.query()) == []
+    write_legacy_history(tmp_path, [make_activity("old1")])
+    assert store.migrate_legacy_history(legacy_path) == 1
+
+
+def test_vocabulary_index_is_backfilled_once(store):
+    store.append(make_activity("a", vocabulary=["Sea", "sea ", "boat"]))
+    with store.connect() as connection:
+        connection.execute("DELETE FROM history_vocabulary")
+    assert list(store.query({"word": "sea"})) == []
+    assert store.index_vocabulary() == 1
+    assert store.index_vocabulary() == 0
+    assert [json.loads(data)["id"] for _, data in store.query({"word": "SEA"})] == ["a"]
+    with store.connect() as connection:
+        assert connection.execute("SELECT COUNT(*) FROM history_vocabulary").fetchone()[0] == 2
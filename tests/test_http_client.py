@@ -0,0 +1,42 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the shared HTTP client's latency stats.
+"""
+
+
+import os
+import pytest
+import backend.http_client as http_client
+from backend.http_client import HttpClient, get_process_latency_stats
+
+
+def test_latency_stats_are_added_up_across_processes(tmp_path, monkeypatch):
+    path = os.path.join(tmp_path, 'jobs.sqlite3')
+    web = HttpClient(stats_path=path, stats_flush_seconds=3600)
+    worker = HttpClient(stats_path=path, stats_flush_seconds=3600)
+    web.record_latency('roster', 0.2)
+    worker.record_latency('roster', 0.4, failed=True)
+    worker.record_latency('image_download', 1.0)
+    # Nothing is written before the flush interval has passed.
+    assert get_process_latency_stats(path) == {}
+    monkeypatch.setattr(http_client.os, 'getpid', lambda: 1)
+    web.flush_latency_stats()
+    monkeypatch.setattr(http_client.os, 'getpid', lambda: 2)
+    worker.flush_latency_stats()
+    # Flushing again replaces the process's row instead of adding to it.
+    worker.flush_latency_stats()
+    stats = get_process_latency_stats(path)
+    assert stats['roster']["count"] == 2
+    assert stats['roster']["errors"] == 1
+    assert stats['roster']["processes"] == 2
+    assert stats['roster']["max_seconds"] == 0.4
+    assert stats['roster']["mean_seconds"] == pytest.approx(0.3)
+    assert stats['image_download']["count"] == 1
+
+
+def test_counters_are_flushed_once_the_interval_has_passed(tmp_path):
+    path = os.path.join(tmp_path, 'jobs.sqlite3')
+    client = HttpClient(stats_path=path, stats_flush_seconds=0)
+    client.record_latency('course', 0.1)
+    assert get_process_latency_stats(path)['course']["count"] == 1
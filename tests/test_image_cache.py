@@ -0,0 +1,89 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the prompt-keyed image cache.
+"""
+
+
+import os
+from types import SimpleNamespace
+import pytest
+import backend.image_generator as image_generator
+from backend.image_cache import ImageCache
+from backend.image_generator import ImageGenerator
+from backend.image_variants import MATERIALS_BUCKET_URL
+
+ACTIVITY_DATA = {"sentence": "The sea is blue.", "target_vocabulary": ["sea"], "media": {"style": "watercolour"}}
+
+
+class Limiter:
+    def call(self, fn, tokens=1):
+        return fn()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ImageCache(directory=str(tmp_path))
+
+
+@pytest.fixture
+def generations(cache, monkeypatch):
+    "Generates images without OpenAI or S3 and records the prompts sent for generation."
+    prompts = []
+
+    def call_openai(call):
+        client = SimpleNamespace(images=SimpleNamespace(generate=lambda **request: prompts.append(request["prompt"]) or SimpleNamespace(data=[SimpleNamespace(url="https://openai/image.png")])))
+        return call(client)
+
+    monkeypatch.setattr(image_generator, 'get_image_cache', lambda: cache)
+    monkeypatch.setattr(image_generator, 'get_rate_limiter', lambda name: Limiter())
+    monkeypatch.setattr(image_generator, 'call_openai', call_openai)
+    monkeypatch.setattr(image_generator, 'stream_image_to_s3', lambda url, image_id, copy_to=None: None)
+    monkeypatch.setattr(image_generator, 'generate_image_variants', lambda path, image_id: {"image/webp": f"{image_id}_480w.webp 480w"})
+    return prompts
+
+
+def test_key_covers_the_whole_request():
+    key = ImageCache.make_key("dall-e-3", "prompt", "1792x1024", "hd")
+    assert key == ImageCache.make_key("dall-e-3", "prompt", "1792x1024", "hd")
+    assert key != ImageCache.make_key("dall-e-3", "prompt", "1792x1024", "standard")
+    assert key != ImageCache.make_key("dall-e-3", "other prompt", "1792x1024", "hd")
+
+
+def test_put_and_get(cache):
+    key = ImageCache.make_key("dall-e-3", "prompt", "1792x1024", "hd")
+    assert cache.get(key) is None
+    cache.put(key, "a1", "https://s3/a1", {"image/webp": "srcset"})
+    assert cache.get(key) == {"key": key, "image_key": "a1", "image_src": "https://s3/a1", "image_srcset": {"image/webp": "srcset"}}
+
+
+def test_unreadable_entry_is_a_miss(cache):
+    key = ImageCache.make_key("dall-e-3", "prompt", "1792x1024", "hd")
+    os.makedirs(os.path.dirname(cache.path(key)))
+    with open(cache.path(key), 'w') as file:
+        file.write('{"image_src": ')
+    assert cache.get(key) is None
+
+
+def test_unchanged_prompt_reuses_the_image(generations):
+    first = ImageGenerator(dict(ACTIVITY_DATA))
+    assert first.generate_image("a1") == MATERIALS_BUCKET_URL + "a1"
+    second = ImageGenerator(dict(ACTIVITY_DATA))
+    assert second.generate_image("a2") == MATERIALS_BUCKET_URL + "a1"
+    assert second.image_srcset == {"image/webp": "a1_480w.webp 480w"}
+    assert len(generations) == 1
+
+
+def test_changed_prompt_generates_a_new_image(generations):
+    ImageGenerator(dict(ACTIVITY_DATA)).generate_image("a1")
+    assert ImageGenerator(dict(ACTIVITY_DATA, sentence="The sky is grey.")).generate_image("a2") == MATERIALS_BUCKET_URL + "a2"
+    assert len(generations) == 2
+
+
+def test_force_regenerate_skips_and_refreshes_the_cache(generations):
+    ImageGenerator(dict(ACTIVITY_DATA)).generate_image("a1")
+    assert ImageGenerator(dict(ACTIVITY_DATA)).generate_image("a2", force_regenerate=True) == MATERIALS_BUCKET_URL + "a2"
+    assert len(generations) == 2
+    # The forced image replaces the cached one for later activities.
+    assert ImageGenerator(dict(ACTIVITY_DATA)).generate_image("a3") == MATERIALS_BUCKET_URL + "a2"
+    assert len(generations) == 2
@@ -0,0 +1,60 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the responsive image variants.
+"""
+
+
+import io
+import os
+import threading
+import pytest
+import backend.image_variants as image_variants
+from backend.image_variants import make_image_variant, generate_image_variants, MATERIALS_BUCKET_URL
+
+Image = pytest.importorskip("PIL.Image", reason="image variants require Pillow")
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        with self.lock:
+            self.objects[Key] = dict(kwargs, Body=Body)
+
+
+@pytest.fixture
+def source_path(tmp_path):
+    path = os.path.join(tmp_path, 'image.png')
+    Image.new('RGBA', (1024, 768), (30, 120, 200, 255)).save(path)
+    return path
+
+
+def open_variant(body):
+    return Image.open(io.BytesIO(body))
+
+
+def test_variant_is_scaled_down_and_encoded(source_path):
+    variant = open_variant(make_image_variant(source_path, 480, "image/webp"))
+    assert (variant.format, variant.size) == ("WEBP", (480, 360))
+    variant = open_variant(make_image_variant(source_path, 960, "image/jpeg"))
+    assert (variant.format, variant.size, variant.mode) == ("JPEG", (960, 720), "RGB")
+
+
+def test_variant_is_never_scaled_up(source_path):
+    assert open_variant(make_image_variant(source_path, 1440, "image/jpeg")).size == (1024, 768)
+
+
+def test_variants_are_uploaded_and_listed_in_srcsets(source_path, monkeypatch):
+    client = FakeS3Client()
+    monkeypatch.setattr(image_variants, 'get_s3_client', lambda: client)
+    srcset = generate_image_variants(source_path, "a1", widths=[960, 480])
+    assert list(srcset) == ["image/webp", "image/jpeg"]
+    assert srcset["image/webp"] == f"{MATERIALS_BUCKET_URL}a1_480w.webp 480w, {MATERIALS_BUCKET_URL}a1_960w.webp 960w"
+    assert sorted(client.objects) == ["a1_480w.jpg", "a1_480w.webp", "a1_960w.jpg", "a1_960w.webp"]
+    upload = client.objects["a1_960w.webp"]
+    assert upload["ContentType"] == "image/webp"
+    assert "immutable" in upload["CacheControl"]
+    assert open_variant(upload["Body"]).size == (960, 720)
@@ -0,0 +1,21 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the test guarding the web app's cold-start imports.
+
+The import time itself depends on the machine, so the millisecond budget is only
+checked by the CLI, python -m backend.import_budget.
+
+Run it with:
+    - python -m pytest tests
+"""
+
+
+import pytest
+from backend.import_budget import measure_app_import
+
+pytest.importorskip("flask", reason="importing app.py requires Flask")
+
+
+def test_app_does_not_import_heavy_modules():
+    assert measure_app_import()["heavy_modules"] == []
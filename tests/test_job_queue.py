@@ -0,0 +1,139 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the durable job queue and its workers.
+"""
+
+
+import os
+import pytest
+import backend.job_queue as job_queue
+import backend.job_worker as job_worker
+from backend.job_queue import JobQueue
+from backend.job_worker import JobWorker
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue.time, 'time', clock.time)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(path=os.path.join(tmp_path, 'jobs.sqlite3'), lease_seconds=60, retry_backoff_seconds=10, max_retry_backoff_seconds=15)
+
+
+def test_lease_complete(queue):
+    job_id = queue.enqueue("activity", {"activity_id": "a"})
+    job = queue.lease("worker-1")
+    assert (job["id"], job["status"], job["attempts"], job["payload"]) == (job_id, "running", 1, {"activity_id": "a"})
+    assert queue.lease("worker-2") is None
+    queue.complete(job_id, "worker-1", {"ok": True})
+    assert queue.get(job_id)["status"] == "succeeded"
+    assert queue.get(job_id)["result"] == {"ok": True}
+
+
+def test_heartbeat_keeps_the_lease(queue, clock):
+    job_id = queue.enqueue("activity")
+    queue.lease("worker-1")
+    clock.now += 50
+    assert queue.heartbeat(job_id, "worker-1")
+    clock.now += 50
+    assert queue.lease("worker-2") is None
+    assert not queue.heartbeat(job_id, "worker-2")
+
+
+def test_expired_lease_is_handed_to_the_next_worker(queue, clock):
+    job_id = queue.enqueue("activity")
+    queue.lease("worker-1")
+    clock.now += 61
+    job = queue.lease("worker-2")
+    assert (job["id"], job["lease_owner"], job["attempts"]) == (job_id, "worker-2", 2)
+    assert not queue.heartbeat(job_id, "worker-1")
+    # The first worker finishing late cannot overwrite the new attempt.
+    queue.complete(job_id, "worker-1", {"late": True})
+    assert queue.get(job_id)["status"] == "running"
+
+
+def test_expired_lease_on_the_last_attempt_fails_the_job(queue, clock):
+    job_id = queue.enqueue("activity", max_attempts=1)
+    queue.lease("worker-1")
+    clock.now += 61
+    assert queue.lease("worker-2") is None
+    assert queue.get(job_id)["status"] == "failed"
+
+
+def test_failed_job_is_requeued_after_a_backoff_with_fresh_stages(queue, clock):
+    job_id = queue.enqueue("activity")
+    queue.lease("worker-1")
+    queue.update_stage(job_id, "set_image_src", "done")
+    queue.fail(job_id, "worker-1", RuntimeError("boom"))
+    job = queue.get(job_id)
+    assert (job["status"], job["error"], job["available_at"]) == ("queued", "boom", 1010.0)
+    assert queue.lease("worker-1") is None
+    clock.now += 10
+    job = queue.lease("worker-1")
+    assert job["attempts"] == 2
+    assert job["stages"] == {}
+    assert job["previous_stages"] == {"set_image_src": "done"}
+    # The backoff doubles per attempt, up to the maximum.
+    queue.fail(job_id, "worker-1", RuntimeError("boom"))
+    assert queue.get(job_id)["available_at"] == clock.now + 15
+
+
+def test_job_fails_after_max_attempts(queue, clock):
+    job_id = queue.enqueue("activity", max_attempts=2)
+    for _ in range(2):
+        queue.fail(queue.lease("worker-1")["id"], "worker-1", RuntimeError("boom"))
+        clock.now += 60
+    job = queue.get(job_id)
+    assert (job["status"], job["attempts"], job["available_at"]) == ("failed", 2, None)
+    assert queue.lease("worker-1") is None
+
+
+def test_worker_records_the_handler_outcome(queue, monkeypatch):
+    def fail(job, on_step):
+        on_step("step", "running")
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(job_worker.JOB_HANDLERS, "failing", fail)
+    monkeypatch.setitem(job_worker.JOB_HANDLERS, "working", lambda job, on_step: {"done": True})
+    failing_id = queue.enqueue("failing", max_attempts=1)
+    working_id = queue.enqueue("working")
+    worker = JobWorker(queue=queue, worker_id="worker-1")
+    assert worker.run_once() and worker.run_once()
+    assert not worker.run_once()
+    assert (queue.get(failing_id)["status"], queue.get(failing_id)["error"]) == ("failed", "boom")
+    assert queue.get(failing_id)["stages"] == {"step": "running"}
+    assert queue.get(working_id)["result"] == {"done": True}
+
+
+@pytest.mark.parametrize("previous_stages, forced", [({}, True), ({"set_image_src": "running"}, True), ({"set_image_src": "done"}, False)])
+def test_retried_activity_job_reuses_the_generated_image(monkeypatch, previous_stages, forced):
+    services = []
+
+    class FakeActivityService:
+        def __init__(self, workspace, force_regenerate_image):
+            services.append(force_regenerate_image)
+
+        def analyze_activity(self):
+            pass
+
+        def build_activity(self, on_step):
+            return {}
+
+    monkeypatch.setattr(job_worker, 'ActivityService', FakeActivityService)
+    monkeypatch.setattr(job_worker, 'JobWorkspace', lambda activity_id: None)
+    job = {"payload": {"activity_id": "a", "force_regenerate_image": True}, "previous_stages": previous_stages}
+    job_worker.run_activity_job(job, lambda stage, status: None)
+    assert services == [forced]
@@ -0,0 +1,77 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the background log shipper.
+"""
+
+
+import os
+import gzip
+from backend.log_shipper import LogShipper
+
+
+class FakeS3Client:
+    "Local stand-in for the S3 client, keeping the objects in memory; `failures` makes the next uploads raise."
+    def __init__(self, failures=0):
+        self.objects = {}
+        self.failures = failures
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("S3 is unavailable")
+        self.objects[(Bucket, Key)] = dict(kwargs, Body=Body.read())
+
+
+def write_log(tmp_path, name, text):
+    path = os.path.join(tmp_path, name)
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def make_shipper(tmp_path, client, **kwargs):
+    return LogShipper(client=client, bucket='logs', spool_dir=os.path.join(tmp_path, 'spool'), **kwargs)
+
+
+def test_spooled_batch_is_shipped_gzipped(tmp_path):
+    client = FakeS3Client()
+    shipper = make_shipper(tmp_path, client, batch_bytes=10 ** 6, interval=3600)
+    shipper.submit(write_log(tmp_path, 'a.log', 'first job\n'), 'job_a.log')
+    shipper.submit(write_log(tmp_path, 'b.log', 'second job\n'), 'job/b.log')
+    # Neither the size nor the interval is reached yet.
+    assert shipper.flush() == 0
+    assert shipper.flush(force=True) == 2
+    assert gzip.decompress(client.objects[('logs', 'job_a.log')]["Body"]) == b'first job\n'
+    assert gzip.decompress(client.objects[('logs', 'job/b.log')]["Body"]) == b'second job\n'
+    assert client.objects[('logs', 'job_a.log')]["ContentEncoding"] == 'gzip'
+    assert shipper.list_spool() == []
+
+
+def test_batch_is_due_once_it_reaches_the_size(tmp_path):
+    client = FakeS3Client()
+    shipper = make_shipper(tmp_path, client, batch_bytes=1, interval=3600)
+    shipper.submit(write_log(tmp_path, 'a.log', 'job\n'), 'job_a.log')
+    assert shipper.flush() == 1
+
+
+def test_failed_upload_is_retried_from_the_spool(tmp_path):
+    client = FakeS3Client(failures=1)
+    shipper = make_shipper(tmp_path, client, batch_bytes=1, interval=3600, max_backoff=3600)
+    shipper.submit(write_log(tmp_path, 'a.log', 'first job\n'), 'job_a.log')
+    shipper.submit(write_log(tmp_path, 'b.log', 'second job\n'), 'job_b.log')
+    assert shipper.flush() == 0
+    assert len(shipper.list_spool()) == 2
+    # Backing off: the batch is not due until the retry time.
+    assert shipper.flush() == 0
+    shipper.retry_at = 0.0
+    assert shipper.flush() == 2
+    assert shipper.failures == 0
+    assert shipper.list_spool() == []
+    # A restarted process ships whatever another shipper left in the spool.
+    client.failures = 1
+    shipper.submit(write_log(tmp_path, 'c.log', 'third job\n'), 'job_c.log')
+    assert shipper.flush() == 0
+    assert make_shipper(tmp_path, client).flush(force=True) == 1
+    assert gzip.decompress(client.objects[('logs', 'job_c.log')]["Body"]) == b'third job\n'
+
@@ -0,0 +1,45 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the OpenAI rate limiters.
+"""
+
+
+import os
+import asyncio
+from backend.rate_limiter import TokenBucket, SharedTokenBucket, RateLimiter
+
+
+def test_token_bucket_makes_callers_wait_once_empty():
+    bucket = TokenBucket(60, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.9 < bucket.reserve() <= 1.0
+
+
+def test_shared_bucket_budget_is_shared_across_processes(tmp_path):
+    path = os.path.join(tmp_path, 'jobs.sqlite3')
+    # Two instances over one database stand in for two worker processes.
+    first = SharedTokenBucket('chat.requests', 60, capacity=2, path=path)
+    second = SharedTokenBucket('chat.requests', 60, capacity=2, path=path)
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert 0.9 < first.reserve() <= 1.0
+    assert 1.9 < second.reserve() <= 2.0
+
+
+def test_shared_bucket_pause_applies_to_every_process(tmp_path):
+    path = os.path.join(tmp_path, 'jobs.sqlite3')
+    first = SharedTokenBucket('images.requests', 60, path=path)
+    second = SharedTokenBucket('images.requests', 60, path=path)
+    first.pause(5)
+    assert 4.5 < second.reserve() <= 5.0
+
+
+def test_call_async_awaits_the_call(tmp_path):
+    limiter = RateLimiter(60, 1000, name='chat', path=os.path.join(tmp_path, 'jobs.sqlite3'))
+
+    async def call():
+        return "done"
+
+    assert asyncio.run(limiter.call_async(call, tokens=10)) == "done"
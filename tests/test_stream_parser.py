@@ -0,0 +1,119 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the streamed activity parsing and the '/baba/stream' endpoint.
+"""
+
+
+import json
+import pytest
+from types import SimpleNamespace
+import backend.connectors as connectors
+from backend.completion_cache import CompletionCache
+from backend.stream_parser import ActivityStreamParser
+
+ACTIVITY = {
+    "media": {"style": "soft \"watercolour\" café"},
+    "sentence": "Ana said: \"the sea\\sky is blue\" — and left.\nThe end.",
+    "questions": {key: {"sentence": f"Question {key}?", "answer": "true"} for key in ["1", "2", "3"]},
+}
+CONTENT = json.dumps(ACTIVITY, ensure_ascii=True)
+
+
+def feed_chunks(chunks):
+    parser = ActivityStreamParser()
+    updates = [parser.feed(chunk) for chunk in chunks]
+    return parser, updates
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(CONTENT)])
+def test_fields_survive_any_chunk_split(size):
+    # Sizes 1 to 7 split escapes and \uXXXX sequences across chunks.
+    parser, _ = feed_chunks([CONTENT[i:i + size] for i in range(0, len(CONTENT), size)])
+    assert parser.fields == {"media.style": ACTIVITY["media"]["style"], "sentence": ACTIVITY["sentence"], "questions": ACTIVITY["questions"]}
+    assert parser.result() == ACTIVITY
+
+
+def test_string_fields_grow_as_they_stream():
+    parser, updates = feed_chunks(['{"sentence": "The s', 'ea is', ' blue."', ', "questions": {"1": {"sentence"'])
+    assert [update.get("sentence") for update in updates] == ["The s", "The sea is", "The sea is blue.", None]
+    # A key that matches a field name inside another object is not mistaken for it.
+    assert "sentence" not in updates[3]
+
+
+def test_partial_sentences_never_show_a_broken_escape():
+    parser, updates = feed_chunks(['{"sentence": "caf\\u00', 'e9 \\"', 'ok\\""}'])
+    assert [update["sentence"] for update in updates] == ["caf", "café \"", "café \"ok\""]
+
+
+def test_questions_are_reported_once_complete():
+    questions = json.dumps(ACTIVITY["questions"])
+    parser, updates = feed_chunks(['{"questions": ', questions[:20], questions[20:], '}'])
+    assert [("questions" in update) for update in updates] == [False, False, True, False]
+    assert updates[2]["questions"] == ACTIVITY["questions"]
+
+
+class Limiter:
+    def call(self, fn, tokens=1):
+        return fn()
+
+
+def make_stream_chunk(content):
+    return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+def test_connector_streams_partials_then_caches_the_activity(tmp_path, monkeypatch):
+    cache = CompletionCache(directory=str(tmp_path))
+    streams = []
+
+    def call_openai(call):
+        streams.append(call)
+        return iter([make_stream_chunk(None)] + [make_stream_chunk(CONTENT[i:i + 16]) for i in range(0, len(CONTENT), 16)])
+
+    monkeypatch.setattr(connectors, 'get_completion_cache', lambda: cache)
+    monkeypatch.setattr(connectors, 'get_rate_limiter', lambda name: Limiter())
+    monkeypatch.setattr(connectors, 'call_openai', call_openai)
+    partials = []
+    activity = connectors.FmLottieConnector().stream_activity_sentence("prompt", on_partial=partials.append)
+    assert activity == ACTIVITY
+    assert len(partials) > 3
+    assert partials[-1].get("questions") == ACTIVITY["questions"]
+    # A second stream of the same prompt is replayed from the cache in one chunk.
+    partials = []
+    assert connectors.FmLottieConnector().stream_activity_sentence("prompt", on_partial=partials.append) == ACTIVITY
+    assert len(streams) == 1
+    assert partials == [{"media.style": ACTIVITY["media"]["style"], "sentence": ACTIVITY["sentence"], "questions": ACTIVITY["questions"]}]
+
+
+def test_sse_endpoint_streams_partial_and_complete_events(monkeypatch):
+    pytest.importorskip("flask", reason="the endpoint test requires Flask")
+    import app
+    import backend.activity_blueprint_service as activity_blueprint_service
+
+    class FakeActivityBlueprintService:
+        def __init__(self):
+            self.builder = self
+
+        def build_activity_blueprint(self):
+            parser = ActivityStreamParser()
+            for chunk in [CONTENT[:30], CONTENT[30:90], CONTENT[90:]]:
+                updates = parser.feed(chunk)
+                if updates:
+                    self.on_partial_sentence(updates)
+
+        @property
+        def activity(self):
+            return self
+
+        def to_dict(self):
+            return {"id": "a1"}
+
+    monkeypatch.setattr(activity_blueprint_service, 'ActivityBlueprintService', FakeActivityBlueprintService)
+    response = app.app.test_client().get('/baba/stream')
+    assert response.mimetype == 'text/event-stream'
+    events = [event.split("\n") for event in response.get_data(as_text=True).strip().split("\n\n")]
+    names = [lines[0][len("event: "):] for lines in events]
+    payloads = [json.loads(lines[1][len("data: "):]) for lines in events]
+    assert names[-1] == "complete" and payloads[-1] == {"id": "a1"}
+    assert set(names[:-1]) == {"partial"}
+    assert payloads[-2]["questions"] == ACTIVITY["questions"]
@@ -0,0 +1,73 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the CEFR text analysis.
+"""
+
+
+import pytest
+import backend.text_analyzer as text_analyzer
+from backend.text_analyzer import tokenize, get_lemma_candidates, analyze_texts, round_cefr_level
+
+WORD_LEVELS = {"the": 1.0, "cat": 1.0, "run": 1.4, "big": 1.5, "be": 1.0, "child": 1.2, "stop": 2.5, "enormous": 3.6, "meticulous": 5.2}
+
+
+class FakeCEFRAnalyzer:
+    def get_average_word_level_float(self, word):
+        return WORD_LEVELS.get(word)
+
+
+@pytest.fixture(autouse=True)
+def analyzer(monkeypatch):
+    monkeypatch.setattr(text_analyzer, 'get_cefr_analyzer', lambda: FakeCEFRAnalyzer())
+    text_analyzer.get_word_level.cache_clear()
+    yield
+    text_analyzer.get_word_level.cache_clear()
+
+
+def test_tokenize_drops_punctuation_case_digits_and_contractions():
+    assert tokenize("The CAT's running, isn't it? 42 cats!") == ["the", "cat", "running", "is", "it", "cats"]
+    assert tokenize("Can’t stop - won't stop.") == ["can", "stop", "will", "stop"]
+    assert tokenize("") == []
+
+
+def test_lemma_candidates_cover_inflections():
+    assert get_lemma_candidates("children")[:2] == ["children", "child"]
+    assert "stop" in get_lemma_candidates("stopped")
+    assert "big" in get_lemma_candidates("bigger")
+    assert "study" in get_lemma_candidates("studies")
+    assert get_lemma_candidates("cat") == ["cat"]
+
+
+def test_round_cefr_level_rounds_halves_up():
+    assert [round_cefr_level(level) for level in [1.4, 1.5, 2.5, 3.5, 3.49]] == [1, 2, 3, 4, 3]
+
+
+def test_report_fields():
+    report = analyze_texts(["The cat is running. The CAT is big, enormous, meticulous!", "zzz"], "b1")[0]
+    assert report["cefr_level"] == "b1"
+    assert report["word_count"] == 10
+    assert report["known_word_count"] == 10
+    assert report["distribution"] == {"A1": 7, "A2": 1, "B1": 0, "B2": 1, "C1": 1, "C2": 0}
+    assert report["share_above_target"] == 0.2
+    # Hardest first, each offending word listed once with the lemma it was found under.
+    assert [(word["word"], word["lemma"], word["level"]) for word in report["offending_words"]] == [("meticulous", "meticulous", "C1"), ("enormous", "enormous", "B2")]
+    assert report["unknown_words"] == []
+
+
+def test_unknown_words_are_listed_once():
+    report = analyze_texts(["zzz zzz cat"], "a1")[0]
+    assert report["unknown_words"] == ["zzz"]
+    assert report["known_word_count"] == 1
+
+
+def test_pre_a1_target_uses_the_a1_ceiling():
+    report = analyze_texts(["The cat is big and stops."], "pre-a1")[0]
+    assert [word["word"] for word in report["offending_words"]] == ["stops", "big"]
+    assert report["share_above_target"] == round(2 / 5, 4)
+
+
+def test_without_target_nothing_is_scored():
+    report = analyze_texts(["The enormous cat."])[0]
+    assert report["share_above_target"] is None
+    assert report["offending_words"] == []
@@ -0,0 +1,28 @@
+"""
+Author : Peter Kramar
+Email : peter@ked.tech
+This module contains the tests of the job-scoped workspaces.
+"""
+
+
+import os
+import uuid
+import pytest
+from backend.workspace import JobWorkspace, write_json_atomic
+
+
+def test_workspace_refuses_ids_that_are_not_uuids(tmp_path):
+    for activity_id in ["../../x", "abc", "/etc"]:
+        with pytest.raises(ValueError):
+            JobWorkspace(activity_id, root=str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_open_requires_an_existing_blueprint(tmp_path):
+    activity_id = str(uuid.uuid4())
+    with pytest.raises(FileNotFoundError):
+        JobWorkspace.open(activity_id, root=str(tmp_path))
+    write_json_atomic(os.path.join(tmp_path, activity_id, 'activity_blueprint.json'), {"id": activity_id})
+    workspace = JobWorkspace.open(activity_id.upper(), root=str(tmp_path))
+    assert workspace.activity_id == activity_id
+    assert workspace.path == os.path.join(str(tmp_path), activity_id)